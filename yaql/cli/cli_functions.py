@@ -89,11 +89,11 @@ def load_data(data_file, context):
                                                          e.strerror))
         return
     try:
-        data = json.loads(json_str)
+        data = utils.loads_json(json_str)
     except ValueError as e:
         print('Unable to parse data: ' + str(e))
         return
-    context['$'] = utils.convert_input_data(data)
+    context['$'] = data
     print(f'Data from file {data_file} loaded into context')
 
 
@@ -121,6 +121,18 @@ def evaluate(expr, parser, data, context):
         exit(1)
 
 
+def evaluate_stream(expr, parser, data, context):
+    try:
+        for res in parser(expr).stream(data, context):
+            if context['#nativeOutput']:
+                print(res)
+            else:
+                print(json.dumps(res, ensure_ascii=False))
+    except Exception as ex:
+        print(f'Execution exception: {ex}', file=sys.stderr)
+        exit(1)
+
+
 def print_output(v, context):
     if context['#nativeOutput']:
         print(v)
@@ -13,26 +13,35 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
+import contextlib
 import optparse
 import sys
 
 import yaql
 from yaql.cli import cli_functions
+from yaql.language import utils
 import yaql.legacy
 
 
+def report_line_error(number, error):
+    print(f'Unable to parse line {number}: {error}', file=sys.stderr)
+
+
 def read_data(f, options):
+    if options.stream:
+        if options.string:
+            return (line.rstrip('\n') for line in f)
+        return utils.load_json_lines(f, report_line_error)
     if options.string:
         if options.array:
-            return [line.rstrip('\n') for line in f]
+            return tuple(line.rstrip('\n') for line in f)
         else:
             return f.read()
     else:
         if options.array:
-            return [json.loads(s) for s in f.readlines()]
+            return tuple(utils.loads_json(s) for s in f.readlines())
         else:
-            return json.load(f)
+            return utils.load_json(f)
 
 
 def main():
@@ -44,14 +53,20 @@ def main():
                  help="output data in Python native format")
     p.add_option('--array', '-a', action='store_true',
                  help="read input line by line")
+    p.add_option('--stream', '-r', action='store_true',
+                 help="read input line by line lazily and write each element "
+                      "of the result on a separate line as it is produced "
+                      "(requires a single expression, lines that cannot be "
+                      "parsed are reported and skipped)")
     p.add_option('--tokens', '-t', action='store_true', dest='tokens',
                  help="print lexical tokens info")
     p.add_option('--legacy', '-l', action='store_true', dest='legacy',
                  help="enable legacy v0.2 compatibility mode")
     p.add_option('--limit', '--limit-iterators', '-L', type=int,
                  dest='limit_iterators',
-                 default=1000, help="limit iterators by the given number of "
-                                    "elements (-1 means infinity)")
+                 default=None, help="limit iterators by the given number of "
+                                    "elements (-1 means infinity, default is "
+                                    "1000 or infinity in streaming mode)")
     p.add_option('--sets-to-lists', '-S', action="store_true",
                  dest='sets_to_lists', default=True,
                  help="convert all sets in results to lists")
@@ -73,50 +88,69 @@ def main():
                  help="enable delegate expression parsing")
 
     options, arguments = p.parse_args()
-    if options.data:
-        try:
-            if options.data == '-':
-                data = read_data(sys.stdin, options)
-            else:
-                with open(options.data) as f:
-                    data = read_data(f, options)
-        except Exception:
-            print('Unable to load data from ' + options.data, file=sys.stderr)
-            exit(1)
-    else:
-        data = None
+    if options.stream and len(arguments) != 1:
+        print('Streaming mode requires exactly one expression',
+              file=sys.stderr)
+        exit(1)
+    with contextlib.ExitStack() as stack:
+        if options.data:
+            try:
+                if options.data == '-':
+                    data = read_data(sys.stdin, options)
+                elif options.stream:
+                    # the file is read while the expression is evaluated
+                    data = read_data(
+                        stack.enter_context(open(options.data)), options)
+                else:
+                    with open(options.data) as f:
+                        data = read_data(f, options)
+            except Exception:
+                print('Unable to load data from ' + options.data,
+                      file=sys.stderr)
+                exit(1)
+        else:
+            data = None
 
-    engine_options = {
-        'yaql.limitIterators': options.limit_iterators,
-        'yaql.convertSetsToLists': options.sets_to_lists,
-        'yaql.convertTuplesToLists': options.tuples_to_lists,
-        'yaql.iterableDicts': options.iterable_dicts,
-        'yaql.memoryQuota': options.memory
-    }
+        limit_iterators = options.limit_iterators
+        if limit_iterators is None:
+            # streams are unbounded, the output is written as it is produced
+            limit_iterators = -1 if options.stream else 1000
 
-    if options.legacy:
-        factory = yaql.legacy.YaqlFactory(
-            allow_delegates=options.allow_delegates
-        )
-        context = yaql.legacy.create_context()
-        context['legacy'] = True
-    else:
-        factory = yaql.YaqlFactory(
-            allow_delegates=options.allow_delegates,
-            keyword_operator=options.keyword_operator
-        )
-        context = yaql.create_context()
+        engine_options = {
+            'yaql.limitIterators': limit_iterators,
+            'yaql.convertSetsToLists': options.sets_to_lists,
+            'yaql.convertTuplesToLists': options.tuples_to_lists,
+            'yaql.iterableDicts': options.iterable_dicts,
+            'yaql.memoryQuota': options.memory,
+            # read_data() already produces immutable yaql structures
+            'yaql.convertInputData': False
+        }
 
-    if options.native:
-        context['#nativeOutput'] = True
+        if options.legacy:
+            factory = yaql.legacy.YaqlFactory(
+                allow_delegates=options.allow_delegates
+            )
+            context = yaql.legacy.create_context()
+            context['legacy'] = True
+        else:
+            factory = yaql.YaqlFactory(
+                allow_delegates=options.allow_delegates,
+                keyword_operator=options.keyword_operator
+            )
+            context = yaql.create_context()
 
-    parser = factory.create(options=engine_options)
-    cli_functions.register_in_context(context, parser)
+        if options.native:
+            context['#nativeOutput'] = True
 
-    if len(arguments) > 0:
-        for arg in arguments:
-            cli_functions.evaluate(arg, parser, data, context)
-    elif options.tokens:
-        parser('__main(true)').evaluate(data, context)
-    else:
-        parser('__main(false)').evaluate(data, context)
+        parser = factory.create(options=engine_options)
+        cli_functions.register_in_context(context, parser)
+
+        if options.stream:
+            cli_functions.evaluate_stream(arguments[0], parser, data, context)
+        elif len(arguments) > 0:
+            for arg in arguments:
+                cli_functions.evaluate(arg, parser, data, context)
+        elif options.tokens:
+            parser('__main(true)').evaluate(data, context)
+        else:
+            parser('__main(false)').evaluate(data, context)
@@ -0,0 +1,150 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Evaluation of yaql expressions from asyncio code.
+
+yaql evaluation is synchronous and lazy, so Statement.evaluate_async()
+runs it in a thread while coroutines returned by registered coroutine
+functions are awaited on the event loop of the caller. Elements of list
+and dictionary literals, arguments of dict() and results of select() are
+evaluated in a pool of threads so that independent awaitables can be
+awaited concurrently. Coroutine functions called from the synchronous
+evaluation are run on an event loop of a dedicated thread, so evaluate()
+also works in threads that already run an event loop.
+
+The same thread pool is used to call methods of yaqlized objects
+concurrently.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import os
+import threading
+
+
+# key of the context value holding AsyncBridge of the current evaluation
+BRIDGE_KEY = '#asyncBridge'
+
+# meta key of functions whose arguments may be evaluated concurrently
+CONCURRENT_ARGUMENTS = 'concurrentArguments'
+
+
+def get_max_workers(engine):
+    return engine.options.get('yaql.asyncWorkers') or min(
+        32, (os.cpu_count() or 1) + 4)
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='yaql-asyncio',
+                             daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+class ThreadPool:
+    """Bounded pool of threads evaluating parts of an expression.
+
+    Tasks are only submitted to the pool while there is a free worker for
+    them, otherwise they are evaluated in the calling thread. Thus nested
+    concurrent evaluations never wait for a worker. Exceptions are re-raised
+    with their original tracebacks.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._slots = threading.Semaphore(max_workers)
+
+    def submit(self, func, *args):
+        if self._slots.acquire(blocking=False):
+            try:
+                future = self._executor.submit(func, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            return future
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def call_all(self, funcs):
+        futures = [self.submit(func) for func in funcs]
+        return [future.result() for future in futures]
+
+    def map(self, func, iterable):
+        """Lazily maps the iterable keeping order of the results."""
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(self.submit(func, item))
+            if len(pending) >= self.max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class AsyncBridge(ThreadPool):
+    """Connects evaluation threads with the event loop of the caller."""
+
+    # number of open bridges, used to skip context lookups when there are
+    # no asynchronous evaluations
+    active = 0
+    _lock = threading.Lock()
+
+    def __init__(self, loop, max_workers):
+        super().__init__(max_workers)
+        with AsyncBridge._lock:
+            AsyncBridge.active += 1
+        self.loop = loop
+
+    def run(self, awaitable):
+        return asyncio.run_coroutine_threadsafe(
+            _await(awaitable), self.loop).result()
+
+    def close(self, wait=False):
+        super().close(wait)
+        with AsyncBridge._lock:
+            AsyncBridge.active -= 1
+
+
+def get_bridge(context):
+    if not AsyncBridge.active:
+        return None
+    return context[BRIDGE_KEY]
+
+
+def resolve(awaitable, context):
+    """Returns result of the awaitable returned by a coroutine function."""
+    bridge = get_bridge(context)
+    if bridge is None:
+        return asyncio.run_coroutine_threadsafe(
+            _await(awaitable), _get_loop()).result()
+    return bridge.run(awaitable)
@@ -0,0 +1,355 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Columnar evaluation of simple numeric queries with NumPy.
+
+Chains of where() and select() over a sequence of records are collected
+into a ColumnarQuery. When the query is aggregated with sum(), min(), max()
+or count(), referenced record fields are transposed into NumPy arrays and
+the lambdas are evaluated on whole columns at once. Whenever the result
+cannot be proven to be the same as the one of the row by row evaluation
+(non-numeric values, missing fields, possible integer overflow, division by
+zero, overridden operators, unsupported expressions etc.) the query is
+evaluated row by row.
+
+NumPy is an optional dependency. Without it the columnar execution is never
+enabled.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from yaql.language import expressions
+from yaql.language import utils
+
+
+# integers are kept in int64 arrays as long as it is proven that no
+# intermediate result can overflow
+_INT_BOUND = 2 ** 62
+# larger integers cannot be compared with floats after conversion to float
+_EXACT_FLOAT_INT_BOUND = 2 ** 53
+
+_ARITHMETIC_OPERATORS = {
+    '#operator_+': 'add',
+    '#operator_-': 'subtract',
+    '#operator_*': 'multiply',
+    '#operator_/': 'divide',
+}
+
+_COMPARISON_OPERATORS = {
+    '#operator_>': 'greater',
+    '#operator_<': 'less',
+    '#operator_>=': 'greater_equal',
+    '#operator_<=': 'less_equal',
+    '*equal': 'equal',
+    '*not_equal': 'not_equal',
+}
+
+_LOGICAL_OPERATORS = {
+    '#operator_and': 'logical_and',
+    '#operator_or': 'logical_or',
+}
+
+
+def is_enabled(engine):
+    return numpy is not None and engine.options.get('yaql.columnar', False)
+
+
+class _Fallback(Exception):
+    pass
+
+
+class _Values:
+    """Column (or scalar) of values of one of int, float or bool kinds.
+
+    For integers bound is the maximum absolute value the column may hold.
+    """
+    __slots__ = ('data', 'kind', 'bound')
+
+    def __init__(self, data, kind, bound=None):
+        self.data = data
+        self.kind = kind
+        self.bound = bound
+
+
+class _Evaluator:
+    def __init__(self, source):
+        self.source = source
+        # indexes of the source records that passed all the filters so far
+        self.indexes = None
+        self.value = None
+        self.fields = {}
+        self.used_functions = set()
+
+    def field(self, name):
+        values = self.fields.get(name)
+        if values is None:
+            values = self._transpose(name)
+            self.fields[name] = values
+        if self.indexes is None:
+            return values
+        return _Values(values.data[self.indexes], values.kind, values.bound)
+
+    def _transpose(self, name):
+        column = []
+        append = column.append
+        try:
+            for record in self.source:
+                append(record[name])
+        except (KeyError, TypeError, IndexError):
+            raise _Fallback()
+        types = set(map(type, column))
+        if types == {int}:
+            bound = max(max(column), -min(column)) if column else 0
+            if bound > _INT_BOUND:
+                raise _Fallback()
+            return _Values(numpy.array(column, dtype=numpy.int64), int, bound)
+        elif types == {float}:
+            return _Values(numpy.array(column, dtype=numpy.float64), float)
+        raise _Fallback()
+
+    def evaluate(self, expr):
+        if isinstance(expr, expressions.Constant):
+            value = expr.value
+            if type(value) is int and abs(value) <= _INT_BOUND:
+                return _Values(value, int, abs(value))
+            elif type(value) is float:
+                return _Values(value, float)
+        elif isinstance(expr, expressions.GetContextValue):
+            if expr.path.value in ('$', '$1') and self.value is not None:
+                return self.value
+        elif isinstance(expr, expressions.BinaryOperator):
+            self.used_functions.add(expr.name)
+            if expr.name == '#operator_.':
+                receiver, name = expr.args
+                if self.value is None and isinstance(
+                        receiver, expressions.GetContextValue) and \
+                        receiver.path.value in ('$', '$1') and \
+                        type(name) is expressions.KeywordConstant:
+                    return self.field(name.value)
+                raise _Fallback()
+            left = self.evaluate(expr.args[0])
+            right = self.evaluate(expr.args[1])
+            if expr.name in _ARITHMETIC_OPERATORS:
+                return self._arithmetic(expr.name, left, right)
+            elif expr.name in _COMPARISON_OPERATORS:
+                return self._compare(expr.name, left, right)
+            elif expr.name in _LOGICAL_OPERATORS:
+                if left.kind is bool and right.kind is bool:
+                    func = getattr(numpy, _LOGICAL_OPERATORS[expr.name])
+                    return _Values(func(left.data, right.data), bool)
+        elif isinstance(expr, expressions.UnaryOperator):
+            self.used_functions.add(expr.name)
+            operand = self.evaluate(expr.args[0])
+            if expr.name == '#unary_operator_-' and operand.kind is not bool:
+                return _Values(-operand.data, operand.kind, operand.bound)
+            elif expr.name == '#unary_operator_+' and \
+                    operand.kind is not bool:
+                return operand
+            elif expr.name == '#unary_operator_not' and operand.kind is bool:
+                return _Values(numpy.logical_not(operand.data), bool)
+        raise _Fallback()
+
+    @staticmethod
+    def _arithmetic(name, left, right):
+        if left.kind is bool or right.kind is bool:
+            raise _Fallback()
+        if name == '#operator_/' and not numpy.all(right.data):
+            # Python raises ZeroDivisionError
+            raise _Fallback()
+        if left.kind is int and right.kind is int:
+            if name == '#operator_*':
+                bound = left.bound * right.bound
+            elif name == '#operator_/':
+                bound = left.bound
+            else:
+                bound = left.bound + right.bound
+            if bound > _INT_BOUND:
+                raise _Fallback()
+            if name == '#operator_/':
+                # yaql uses floor division for integers
+                return _Values(
+                    numpy.floor_divide(left.data, right.data), int, bound)
+            func = getattr(numpy, _ARITHMETIC_OPERATORS[name])
+            return _Values(func(left.data, right.data), int, bound)
+        func = getattr(numpy, _ARITHMETIC_OPERATORS[name])
+        return _Values(
+            func(numpy.float64(left.data) if left.kind is int else left.data,
+                 right.data), float)
+
+    @staticmethod
+    def _compare(name, left, right):
+        if left.kind is bool or right.kind is bool:
+            raise _Fallback()
+        if left.kind is not right.kind:
+            int_operand = left if left.kind is int else right
+            if int_operand.bound > _EXACT_FLOAT_INT_BOUND:
+                raise _Fallback()
+        func = getattr(numpy, _COMPARISON_OPERATORS[name])
+        return _Values(func(left.data, right.data), bool)
+
+    def where(self, expr):
+        mask = self.evaluate(expr)
+        if mask.kind is not bool:
+            raise _Fallback()
+        mask = numpy.broadcast_to(mask.data, (self.count(),))
+        if self.value is not None:
+            self.value = _Values(
+                self.value.data[mask], self.value.kind, self.value.bound)
+        else:
+            indexes = numpy.flatnonzero(mask)
+            self.indexes = indexes if self.indexes is None \
+                else self.indexes[indexes]
+
+    def select(self, expr):
+        value = self.evaluate(expr)
+        self.value = _Values(
+            numpy.broadcast_to(value.data, (self.count(),)),
+            value.kind, value.bound)
+
+    def count(self):
+        if self.value is not None:
+            return len(self.value.data)
+        if self.indexes is not None:
+            return len(self.indexes)
+        return len(self.source)
+
+
+class ColumnarQuery(utils.IteratorType):
+    """Lazy chain of where() and select() calls over a sequence of records.
+
+    It is a one-shot iterator giving the same results as the row by row
+    where() and select() would give. The query can be evaluated on columns
+    only until any query of the chain is iterated, and once it is, the whole
+    chain is consumed just like the row by row iterators would be.
+    """
+
+    def __init__(self, source, parent=None, step=None):
+        self.source = source
+        self.parent = parent
+        self.step = step
+        self._rows = None
+
+    @property
+    def steps(self):
+        steps = []
+        query = self
+        while query.parent is not None:
+            steps.append(query.step)
+            query = query.parent
+        return steps[::-1]
+
+    def _chain(self):
+        query = self
+        while query is not None:
+            yield query
+            query = query.parent
+
+    def _is_started(self):
+        return any(query._rows is not None for query in self._chain())
+
+    def _consume(self):
+        for query in self._chain():
+            query._rows = iter(())
+
+    def where(self, predicate):
+        if self._is_started():
+            return filter(predicate, self)
+        return ColumnarQuery(self.source, self, ('where', predicate))
+
+    def select(self, selector):
+        if self._is_started():
+            return map(selector, self)
+        return ColumnarQuery(self.source, self, ('select', selector))
+
+    def __next__(self):
+        if self._rows is None:
+            if self.parent is None:
+                self._rows = iter(self.source)
+            elif self.step[0] == 'where':
+                self._rows = filter(self.step[1], self.parent)
+            else:
+                self._rows = map(self.step[1], self.parent)
+        return next(self._rows)
+
+    def evaluate(self, context):
+        """Evaluates the query on columns.
+
+        Returns the evaluator holding the query result or None if the query
+        must be evaluated row by row.
+        """
+        if self._is_started():
+            return None
+        evaluator = _Evaluator(self.source)
+        try:
+            for kind, func in self.steps:
+                expr = getattr(func, '__unwrapped__', None)
+                if not isinstance(expr, expressions.Expression):
+                    return None
+                getattr(evaluator, kind)(expr)
+        except _Fallback:
+            return None
+        if not utils.is_standard_function(
+                context, *evaluator.used_functions):
+            return None
+        return evaluator
+
+    def _evaluate_values(self, context):
+        evaluator = self.evaluate(context)
+        if evaluator is None or evaluator.value is None:
+            return None
+        values = evaluator.value
+        if values.kind is bool or len(values.data) == 0:
+            return None
+        return values
+
+    def sum(self, context):
+        """Returns sum of the query values or NO_VALUE if not applicable."""
+        values = self._evaluate_values(context)
+        if values is None:
+            return utils.NO_VALUE
+        self._consume()
+        if values.kind is int:
+            if values.bound * len(values.data) <= _INT_BOUND:
+                return int(numpy.sum(values.data))
+            return sum(values.data.tolist())
+        # unlike numpy.sum(), accumulate adds values one by one in order
+        return float(numpy.add.accumulate(values.data)[-1])
+
+    def max(self, context):
+        """Returns max of the query values or NO_VALUE if not applicable."""
+        return self._extremum(context, numpy.max)
+
+    def min(self, context):
+        """Returns min of the query values or NO_VALUE if not applicable."""
+        return self._extremum(context, numpy.min)
+
+    def _extremum(self, context, func):
+        values = self._evaluate_values(context)
+        if values is None:
+            return utils.NO_VALUE
+        result = func(values.data).item()
+        if values.kind is float and (result != result or result == 0):
+            # NaN and signed zeros depend on the order of comparisons
+            return utils.NO_VALUE
+        self._consume()
+        return result
+
+    def count(self, context):
+        """Returns number of the query values or NO_VALUE if not applicable."""
+        evaluator = self.evaluate(context)
+        if evaluator is None:
+            return utils.NO_VALUE
+        self._consume()
+        return evaluator.count()
@@ -12,9 +12,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import asyncio
+import copy
+import operator
 import sys
 
 import yaql
+from yaql.language import asynchronous
 from yaql.language import exceptions
 from yaql.language import utils
 
@@ -71,12 +75,93 @@ class ListExpression(Function):
         self.uses_receiver = False
 
 
+class ConstantListExpression(ListExpression):
+    """List literal of constants that is a target of membership tests.
+
+    The list built by #list is remembered together with a set of its
+    elements (see utils.HashedTuple), so it is neither rebuilt on every
+    evaluation nor scanned by "in" and contains(). Statement evaluates it
+    only when functions it depends on come from the standard library.
+    """
+
+    functions = ('#list',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._cache = None
+
+    def __call__(self, receiver, context, engine):
+        cache = self._cache
+        if cache is None or cache[0] is not engine:
+            value = utils.HashedTuple(
+                super().__call__(receiver, context, engine))
+            self._cache = cache = engine, value
+        return cache[1]
+
+    def __getstate__(self):
+        # the cached value refers to the engine and is rebuilt on demand
+        return dict(self.__dict__, _cache=None)
+
+
+class ConstantRegexExpression(Function):
+    """Regular expression built from a constant pattern.
+
+    It replaces regex() calls with constant arguments and constant string
+    patterns of =~ and !~ operators. The regular expression is compiled by
+    regex() once per engine. Statement evaluates it only when regex() and
+    the functions it is passed to come from the standard library.
+    """
+
+    def __init__(self, original, args, functions=()):
+        super().__init__('regex', *args)
+        self.uses_receiver = original.uses_receiver
+        self.functions = ('regex',) + tuple(functions)
+        self._cache = None
+
+    def __call__(self, receiver, context, engine):
+        cache = self._cache
+        if cache is None or cache[0] is not engine:
+            value = super().__call__(receiver, context, engine)
+            self._cache = cache = engine, value
+        return cache[1]
+
+    def __getstate__(self):
+        return dict(self.__dict__, _cache=None)
+
+
 class MapExpression(Function):
     def __init__(self, *args):
         super().__init__('#map', *args)
         self.uses_receiver = False
 
 
+class ConstantReplacementsExpression(Function):
+    """Dictionary literal of constants passed to replace().
+
+    The dictionary built by #map is converted by #replacements, which
+    prepares its string pairs and the single pass replacer, once per
+    engine. Statement evaluates it only when these functions, replace()
+    and str() come from the standard library.
+    """
+
+    functions = ('#map', '#replacements', 'replace', 'str')
+
+    def __init__(self, original):
+        super().__init__('#replacements', original)
+        self.uses_receiver = False
+        self._cache = None
+
+    def __call__(self, receiver, context, engine):
+        cache = self._cache
+        if cache is None or cache[0] is not engine:
+            value = super().__call__(receiver, context, engine)
+            self._cache = cache = engine, value
+        return cache[1]
+
+    def __getstate__(self):
+        return dict(self.__dict__, _cache=None)
+
+
 class GetContextValue(Function):
     def __init__(self, path):
         super().__init__('#get_context_data', path)
@@ -132,23 +217,123 @@ class MappingRuleExpression(Expression):
             self.destination(receiver, context, engine))
 
 
+def _get_membership_target(expr):
+    """Returns index of the argument tested for membership, if any."""
+    if expr.name == '#operator_in':
+        return 1
+    elif expr.name == '#operator_.' and isinstance(expr.args[1], Function) \
+            and expr.args[1].name == 'contains':
+        return 0
+    return None
+
+
+def _is_constant_argument(expr):
+    if isinstance(expr, MappingRuleExpression):
+        return isinstance(expr.source, KeywordConstant) and isinstance(
+            expr.destination, Constant)
+    return isinstance(expr, Constant)
+
+
+def _precompute_argument(expr, index, arg):
+    """Returns precomputed replacement of the argument or None."""
+    if type(arg) is ListExpression:
+        if index == _get_membership_target(expr) and all(
+                isinstance(t, Constant) for t in arg.args):
+            return ConstantListExpression(*arg.args)
+    elif type(arg) is Function:
+        # regex() is not a method, so it is not precomputed on a receiver
+        if arg.name == 'regex' and arg.args and not (
+                expr.name == '#operator_.' and index == 1) and all(
+                map(_is_constant_argument, arg.args)):
+            return ConstantRegexExpression(arg, arg.args)
+    elif type(arg) is MapExpression:
+        if index == 0 and expr.name == 'replace' and all(
+                isinstance(t, MappingRuleExpression) and
+                isinstance(t.source, Constant) and
+                isinstance(t.destination, Constant) for t in arg.args):
+            return ConstantReplacementsExpression(arg)
+    elif type(arg) is Constant:
+        # string arguments of matches() are not precomputed: the type of
+        # the receiver is not known before evaluation, and in
+        # regex(...).matches('...') the argument is the string to match
+        if index == 1 and expr.name in ('#operator_=~', '#operator_!~') \
+                and isinstance(arg.value, str):
+            return ConstantRegexExpression(arg, (arg,), (expr.name,))
+    return None
+
+
+def _precompute_constants(expr, functions):
+    """Returns the expression with parts that depend on constants only.
+
+    Constant list literals tested for membership, regular expressions
+    built from constant patterns and constant dictionaries of replace() are
+    replaced with nodes that compute them once. The expression itself is
+    not modified: only the nodes on the path to the replaced parts are
+    copied. Names of functions whose standard implementations the
+    replacements rely on are added to functions.
+    """
+    if isinstance(expr, MappingRuleExpression):
+        source = _precompute_constants(expr.source, functions)
+        destination = _precompute_constants(expr.destination, functions)
+        if source is expr.source and destination is expr.destination:
+            return expr
+        expr = copy.copy(expr)
+        expr.source = source
+        expr.destination = destination
+    elif isinstance(expr, Wrap):
+        inner = _precompute_constants(expr.expr, functions)
+        if inner is expr.expr:
+            return expr
+        expr = copy.copy(expr)
+        expr.expr = inner
+    elif isinstance(expr, Function):
+        args = []
+        for index, arg in enumerate(expr.args):
+            arg = _precompute_constants(arg, functions)
+            replacement = _precompute_argument(expr, index, arg)
+            if replacement is not None:
+                arg = replacement
+                functions.update(replacement.functions)
+            args.append(arg)
+        if all(map(operator.is_, args, expr.args)):
+            return expr
+        expr = copy.copy(expr)
+        expr.args = tuple(args)
+    return expr
+
+
 class Statement(Function):
     def __init__(self, expression, engine):
-        self.expression = expression
         self.uses_receiver = False
         self.engine = engine
-        super().__init__('#finalize', expression)
+        self._precomputed_functions = set()
+        self.expression = _precompute_constants(
+            Function('#finalize', expression),
+            self._precomputed_functions).args[0]
+        super().__init__('#finalize', self.expression)
+        # the original expression is evaluated in contexts where functions
+        # the precomputed parts depend on are overridden
+        self._original = None
+        if self.expression is not expression:
+            self._original = Function('#finalize', expression)
 
     def __call__(self, receiver, context, engine):
         if not context.collect_functions('#finalize'):
             context = context.create_child_context()
             context.register_function(lambda x: x, name='#finalize')
+        if context['#memoryAccountant'] is None:
+            context = context.create_child_context()
+            context['#memoryAccountant'] = utils.MemoryAccountant(engine)
+        expression = self
+        if self._original is not None and not utils.is_standard_function(
+                context, *self._precomputed_functions):
+            expression = self._original
         try:
-            return super().__call__(receiver, context, engine)
+            return Function.__call__(expression, receiver, context, engine)
         except exceptions.WrappedException as e:
             raise e.wrapped.with_traceback(sys.exc_info()[2])
 
-    def evaluate(self, data=utils.NO_VALUE, context=None):
+    def _prepare_context(self, data, context):
         if context is None or context is utils.NO_VALUE:
             context = yaql.create_context()
         if data is not utils.NO_VALUE:
@@ -156,7 +341,57 @@ class Statement(Function):
                 context['$'] = utils.convert_input_data(data)
             else:
                 context['$'] = data
+        return context
+
+    def evaluate(self, data=utils.NO_VALUE, context=None):
+        context = self._prepare_context(data, context)
         return self(utils.NO_VALUE, context, self.engine)
 
+    def stream(self, data=utils.NO_VALUE, context=None):
+        """Evaluates the statement yielding elements of the result lazily.
+
+        If the expression returns a collection, its elements are converted
+        to the output format and yielded one by one while the collection is
+        being iterated instead of converting it to a list as a whole. Thus
+        results of queries over lazy inputs (see utils.load_json_lines) are
+        produced without holding them in memory. Other results (scalars,
+        strings and dictionaries) are yielded as a single element.
+        """
+        context = self._prepare_context(data, context).create_child_context()
+        context.register_function(lambda x: x, name='#finalize')
+        result = self(utils.NO_VALUE, context, self.engine)
+        convert = self.engine.options.get('yaql.convertOutputData', True)
+        if not utils.is_iterable(result):
+            yield utils.convert_output_data(
+                result, self._limit, self.engine) if convert else result
+            return
+        for t in self._limit(result):
+            yield utils.convert_output_data(
+                t, self._limit, self.engine) if convert else t
+
+    def _limit(self, iterable):
+        return utils.limit_iterable(iterable, self.engine)
+
+    async def evaluate_async(self, data=utils.NO_VALUE, context=None):
+        """Evaluates the statement without blocking the event loop.
+
+        Coroutines returned by registered functions are awaited on the
+        running event loop. Independent ones, like those in elements of
+        list and dictionary literals or results of select(), are awaited
+        concurrently.
+        """
+        loop = asyncio.get_running_loop()
+        context = self._prepare_context(data, context).create_child_context()
+        bridge = asynchronous.AsyncBridge(
+            loop, asynchronous.get_max_workers(self.engine))
+        context[asynchronous.BRIDGE_KEY] = bridge
+        try:
+            return await loop.run_in_executor(
+                None, self, utils.NO_VALUE, context, self.engine)
+        finally:
+            bridge.close()
+
     def __str__(self):
+        if self._original is not None:
+            return str(self._original.args[0])
         return str(self.expression)
@@ -0,0 +1,281 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Evaluation of yaql lambdas in a pool of worker processes.
+
+The parsed lambda expression is sent to the workers together with chunks of
+the input collection and values of context variables it refers to. Workers
+evaluate it in a default standard library context created with the same
+engine options. Lambdas calling functions that resolve differently in the
+calling context (custom functions, delegates, legacy mode etc.) or referring
+to values that cannot be pickled are evaluated in the calling process
+instead. When evaluation of a chunk fails in a worker, the chunk is evaluated
+again in the calling process to raise the original exception.
+"""
+
+import atexit
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+
+from yaql.language import expressions
+from yaql.language import utils
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+# engines and contexts of the worker process by engine options
+_worker_engines = {}
+
+# default context the worker functions are compared with
+_default_context = None
+
+
+def get_max_workers(engine):
+    return engine.options.get('yaql.parallelWorkers') or os.cpu_count() or 1
+
+
+def _get_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _executors[max_workers] = executor
+        return executor
+
+
+def _discard_executor(executor):
+    with _executors_lock:
+        for key, value in list(_executors.items()):
+            if value is executor:
+                del _executors[key]
+
+
+@atexit.register
+def _shutdown_executors():
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _collect_references(expr, names, functions):
+    if isinstance(expr, expressions.GetContextValue):
+        names.add(expr.path.value)
+        functions.add(expr.name)
+        return True
+    elif isinstance(expr, expressions.Constant):
+        return True
+    elif isinstance(expr, expressions.MappingRuleExpression):
+        args = (expr.source, expr.destination)
+    elif isinstance(expr, expressions.Function):
+        functions.add(expr.name)
+        args = expr.args
+    else:
+        return False
+    return all(_collect_references(arg, names, functions) for arg in args)
+
+
+def _get_function_key(spec):
+    # functions registered by different create_context() calls are distinct
+    # objects, so they are compared by code and captured values
+    payload = spec.payload
+    cells = []
+    for cell in getattr(payload, '__closure__', None) or ():
+        value = cell.cell_contents
+        try:
+            hash(value)
+        except TypeError:
+            value = id(value)
+        cells.append(value)
+    return getattr(payload, '__code__', payload), tuple(cells)
+
+
+def _get_function_keys(context, name):
+    return [frozenset(map(_get_function_key, layer))
+            for layer in context.collect_functions(name)]
+
+
+def _is_worker_function(context, name):
+    global _default_context
+
+    if _default_context is None:
+        import yaql
+
+        _default_context = yaql.create_context()
+    return (_get_function_keys(context, name) ==
+            _get_function_keys(_default_context, name))
+
+
+def prepare_lambda(func, context):
+    """Returns picklable form of the lambda for worker processes.
+
+    Returns None if the lambda cannot be evaluated outside of the calling
+    process.
+    """
+    expr = getattr(func, '__unwrapped__', None)
+    if not isinstance(expr, expressions.Expression):
+        return None
+    names = set()
+    functions = set()
+    if not _collect_references(expr, names, functions):
+        return None
+    if not all(_is_worker_function(context, name) for name in functions):
+        return None
+    variables = {
+        name: context[name] for name in names if name not in ('$', '$1')
+    }
+    payload = (expr, variables)
+    try:
+        pickle.dumps(payload)
+    except Exception:
+        return None
+    return payload
+
+
+def _materialize(value, engine):
+    # iterators produced by the lambda cannot be sent back to the caller
+    if isinstance(value, (str, bytes)):
+        return value
+    elif isinstance(value, utils.MappingType):
+        return utils.FrozenDict(
+            (k, _materialize(v, engine)) for k, v in value.items())
+    elif type(value) in (tuple, list, set, frozenset):
+        return type(value)(_materialize(t, engine) for t in value)
+    elif utils.is_iterable(value):
+        return tuple(_materialize(t, engine)
+                     for t in utils.limit_iterable(value, engine))
+    return value
+
+
+def _get_worker_engine(options):
+    key = tuple(sorted(options.items()))
+    result = _worker_engines.get(key)
+    if result is None:
+        import yaql
+        from yaql.language import factory
+
+        engine = factory.YaqlFactory().create(options=options)
+        result = engine, yaql.create_context()
+        _worker_engines[key] = result
+    return result
+
+
+class _EvaluationError(Exception):
+    """Failure of the chunk evaluation in a worker process.
+
+    Exceptions raised by the lambda cannot always be pickled, so the chunk is
+    evaluated again in the calling process to get the original one.
+    """
+
+
+def _evaluate_chunk(options, payload, items, is_predicate):
+    try:
+        return _evaluate_items(options, payload, items, is_predicate)
+    except Exception as e:
+        raise _EvaluationError(repr(e)) from None
+
+
+def _evaluate_items(options, payload, items, is_predicate):
+    engine, context = _get_worker_engine(options)
+    expr, variables = payload
+    context = context.create_child_context()
+    context['#memoryAccountant'] = utils.MemoryAccountant(engine)
+    for name, value in variables.items():
+        context[name] = value
+    results = []
+    for item in items:
+        item_context = context.create_child_context()
+        item_context['$1'] = item
+        result = expr(utils.NO_VALUE, item_context, engine)
+        if is_predicate:
+            results.append(bool(result))
+        else:
+            results.append(_materialize(result, engine))
+    return results
+
+
+def _chunks(collection, chunk_size):
+    iterator = iter(collection)
+    while True:
+        chunk = tuple(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _evaluate_locally(func, items, is_predicate, engine):
+    if is_predicate:
+        return [bool(func(item)) for item in items]
+    return [_materialize(func(item), engine) for item in items]
+
+
+def evaluate(collection, func, payload, engine, context, chunk_size, ordered,
+             is_predicate):
+    """Evaluates the lambda on every collection element in worker processes.
+
+    Yields pairs of element and lambda result. Results of at most twice as
+    many chunks as there are workers are kept in memory at a time. Chunks
+    whose evaluation failed in a worker are evaluated with func instead.
+    """
+    max_workers = get_max_workers(engine)
+    executor = _get_executor(max_workers)
+    options = dict(engine.options)
+    tracker = utils.get_memory_accountant(context, engine).track([])
+    pending = collections.deque()
+    chunks = _chunks(collection, chunk_size)
+
+    def submit():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        pending.append((chunk, executor.submit(
+            _evaluate_chunk, options, payload, chunk, is_predicate)))
+        return True
+
+    try:
+        while len(pending) < 2 * max_workers and submit():
+            pass
+        while pending:
+            if ordered:
+                chunk, future = pending.popleft()
+            else:
+                concurrent.futures.wait(
+                    [f for _, f in pending],
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                index = next(i for i, (_, f) in enumerate(pending)
+                             if f.done())
+                chunk, future = pending[index]
+                del pending[index]
+            try:
+                results = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                _discard_executor(executor)
+                raise
+            except _EvaluationError:
+                results = _evaluate_locally(func, chunk, is_predicate, engine)
+            submit()
+            for result in results:
+                tracker.add(result)
+            yield from zip(chunk, results)
+            tracker.remove(len(results))
+    finally:
+        for _, future in pending:
+            future.cancel()
+        tracker.release()
@@ -14,8 +14,10 @@
 
 # flake8: noqa: E731
 
+import functools
 import sys
 
+from yaql.language import asynchronous
 from yaql.language import exceptions
 from yaql.language import expressions
 from yaql.language import utils
@@ -112,9 +114,25 @@ def choose_overload(name, candidates, engine, receiver, context, args, kwargs):
         else arg
     )
 
-    args = tuple(arg_evaluator(i, arg) for i, arg in enumerate(args))
-    for key, value in kwargs.items():
-        kwargs[key] = arg_evaluator(key, value)
+    bridge = None
+    if len(args) + len(kwargs) > 1:
+        bridge = asynchronous.get_bridge(context)
+        if bridge is not None and not all(
+                c.meta.get(asynchronous.CONCURRENT_ARGUMENTS)
+                for level in candidates2 for c, _ in level):
+            bridge = None
+    if bridge is not None:
+        funcs = [functools.partial(arg_evaluator, i, arg)
+                 for i, arg in enumerate(args)]
+        funcs.extend(functools.partial(arg_evaluator, key, value)
+                     for key, value in kwargs.items())
+        values = bridge.call_all(funcs)
+        kwargs = dict(zip(kwargs, values[len(args):]))
+        args = tuple(values[:len(args)])
+    else:
+        args = tuple(arg_evaluator(i, arg) for i, arg in enumerate(args))
+        for key, value in kwargs.items():
+            kwargs[key] = arg_evaluator(key, value)
 
     delegate = None
     winner_mapping = None
@@ -14,6 +14,7 @@
 
 import inspect
 
+from yaql.language import asynchronous
 from yaql.language import exceptions
 from yaql.language import utils
 from yaql.language import yaqltypes
@@ -312,6 +313,8 @@ class FunctionDefinition:
                 **dict(map(lambda t: (t[0], t[1](new_context)),
                            keyword_args.items()))
             )
+            if inspect.iscoroutine(result):
+                result = asynchronous.resolve(result, new_context)
             return result
 
         return func
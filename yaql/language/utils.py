@@ -12,9 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import array
 import collections
+import io
+import itertools
+import json
+import pickle
 import re
 import sys
+import tempfile
+import threading
 
 from yaql.language import exceptions
 from yaql.language import lexer
@@ -82,6 +89,55 @@ def convert_input_data(obj, rec=None):
         return obj
 
 
+def _freeze_json_array(array):
+    return tuple(_freeze_json_array(t) if type(t) is list else t
+                 for t in array)
+
+
+def _freeze_json_object(pairs):
+    return FrozenDict(
+        (key, _freeze_json_array(value) if type(value) is list else value)
+        for key, value in pairs)
+
+
+def loads_json(s):
+    """Decodes JSON string directly into yaql immutable structures.
+
+    Produces the same result as convert_input_data(json.loads(s)) but
+    objects are frozen by the decoder itself so that the data is not
+    walked and copied for the second time.
+    """
+    result = json.loads(s, object_pairs_hook=_freeze_json_object)
+    return _freeze_json_array(result) if type(result) is list else result
+
+
+def load_json(fp):
+    """Reads JSON document from file-like object. See loads_json."""
+    return loads_json(fp.read())
+
+
+def load_json_lines(fp, on_error=None):
+    """Lazily decodes newline-delimited JSON from file-like object.
+
+    Yields values of non-empty lines one at a time (see loads_json), so the
+    file is never read into memory as a whole. A line that cannot be
+    decoded raises ValueError with the line number in the message unless
+    on_error callback is given. Then it is called with the line number and
+    the exception and the line is skipped.
+    """
+    for number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            value = loads_json(line)
+        except ValueError as e:
+            if on_error is None:
+                raise ValueError(f'Line {number}: {e}') from e
+            on_error(number, e)
+            continue
+        yield value
+
+
 def convert_output_data(obj, limit_func, engine, rec=None):
     if rec is None:
         rec = convert_output_data
@@ -119,6 +175,104 @@ class MappingRule:
         self.destination = destination
 
 
+class HashedTuple(tuple):
+    """Tuple that tests membership with a set of its elements.
+
+    The set is built once on creation. If some elements are unhashable, or
+    the tested value is, the tuple is scanned as usual.
+    """
+
+    def __new__(cls, iterable=()):
+        self = super().__new__(cls, iterable)
+        try:
+            self._set = frozenset(self)
+        except TypeError:
+            self._set = None
+        return self
+
+    def __contains__(self, value):
+        if self._set is not None:
+            try:
+                return value in self._set
+            except TypeError:
+                pass
+        return super().__contains__(value)
+
+
+class SliceView(collections.abc.Sequence):
+    """Read-only view of a contiguous part of a sequence.
+
+    Slicing of sequences with skip(), limit() and alike produces views
+    instead of copies, so length, indexing and further slicing are O(1)
+    regardless of the position of the part. Views of views refer to the
+    original sequence. Views compare equal to tuples with the same items
+    and hash the same way, as yaql lists are tuples.
+    """
+
+    __slots__ = ('sequence', 'start', 'stop')
+
+    def __init__(self, sequence, start=0, stop=None):
+        length = len(sequence)
+        start = min(max(start, 0), length)
+        stop = length if stop is None else min(max(stop, start), length)
+        if isinstance(sequence, SliceView):
+            start += sequence.start
+            stop += sequence.start
+            sequence = sequence.sequence
+        self.sequence = sequence
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return SliceView(self, start, stop)
+            return tuple(self[i] for i in range(start, stop, step))
+        length = self.stop - self.start
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('index out of range')
+        return self.sequence[self.start + index]
+
+    def __iter__(self):
+        if self.start == 0:
+            return itertools.islice(self.sequence, self.stop)
+        return map(self.sequence.__getitem__, range(self.start, self.stop))
+
+    def __reversed__(self):
+        return map(self.sequence.__getitem__,
+                   range(self.stop - 1, self.start - 1, -1))
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, SliceView)):
+            return len(self) == len(other) and tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def slice_sequence(sequence, start=0, stop=None):
+    """Returns view of the sequence between start and stop indexes.
+
+    Ranges are sliced natively and a sequence is returned as is if the part
+    covers it whole.
+    """
+    if isinstance(sequence, range):
+        return sequence[start:stop]
+    if start <= 0 and (stop is None or stop >= len(sequence)):
+        return sequence
+    return SliceView(sequence, start, stop)
+
+
 class FrozenDict(collections.abc.Mapping):
     def __init__(self, *args, **kwargs):
         self._d = dict(*args, **kwargs)
@@ -147,32 +301,132 @@ class FrozenDict(collections.abc.Mapping):
         return repr(self._d)
 
 
-def memorize(collection, engine):
-    if not is_iterator(collection):
-        return collection
+class MemorizingBuffer:
+    """Remembers items produced by an iterator so it can be read many times.
+
+    Items are kept in a list until their estimated size exceeds
+    yaql.spillThreshold. Then whole chunks of chunk_size items are pickled
+    to an anonymous temporary file and dropped from memory. Readers load the
+    spilled items back one chunk at a time, so each of them holds at most
+    one chunk in memory. If items cannot be pickled they are all kept in
+    memory.
+    """
+
+    def __init__(self, iterable, engine, context=None, chunk_size=256):
+        self.source = iter(iterable)
+        self.values = []
+        self.offset = 0
+        self.chunk_size = chunk_size
+        self._threshold = get_spill_threshold(engine)
+        self._accountant = get_memory_accountant(context, engine)
+        self._tracker = self._accountant.track(self.values)
+        self._file = None
+        self._chunk_positions = array.array('q')
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        with self._lock:
+            try:
+                value = next(self.source)
+            except StopIteration:
+                # the buffer is complete and is no longer growing
+                self._tracker.release()
+                raise
+            self.values.append(value)
+            self._tracker.add(value)
+            if (0 <= self._threshold < self._tracker.size and
+                    len(self.values) >= self.chunk_size):
+                self._spill()
+        return value
+
+    def _spill(self):
+        count = len(self.values) // self.chunk_size
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        try:
+            for _ in range(count):
+                self._file.seek(0, io.SEEK_END)
+                position = self._file.tell()
+                pickle.dump(self.values[:self.chunk_size], self._file,
+                            pickle.HIGHEST_PROTOCOL)
+                self._chunk_positions.append(position)
+                del self.values[:self.chunk_size]
+                self.offset += self.chunk_size
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._threshold = -1
+        self._tracker.release()
+        self._tracker = self._accountant.track(self.values)
+        for value in self.values:
+            self._tracker.add(value)
+
+    def load_chunk(self, index):
+        with self._lock:
+            self._file.seek(self._chunk_positions[index])
+            return pickle.load(self._file)
 
-    yielded = []
+    def __iter__(self):
+        return MemorizedIterator(self)
 
-    class RememberingIterator:
-        def __init__(self):
-            self.seq = iter(collection)
-            self.index = 0
 
-        def __iter__(self):
-            return RememberingIterator()
+class MemorizedIterator:
+    __slots__ = ('_buffer', '_index', '_chunk', '_chunk_index')
 
-        def __next__(self):
-            if self.index < len(yielded):
-                self.index += 1
-                return yielded[self.index - 1]
-            else:
-                val = next(self.seq)
-                yielded.append(val)
-                limit_memory_usage(engine, (1, yielded))
-                self.index += 1
-                return val
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._index = 0
+        self._chunk = None
+        self._chunk_index = -1
 
-    return RememberingIterator()
+    def __iter__(self):
+        return MemorizedIterator(self._buffer)
+
+    def __next__(self):
+        buffer = self._buffer
+        index = self._index
+        while True:
+            # spilling by another reader moves values and offset together
+            with buffer._lock:
+                offset = buffer.offset
+                if index < offset:
+                    break
+                if index < offset + len(buffer.values):
+                    self._index = index + 1
+                    return buffer.values[index - offset]
+            try:
+                buffer.fetch()
+            except StopIteration:
+                # another reader may have fetched the last item meanwhile
+                with buffer._lock:
+                    if index >= buffer.offset + len(buffer.values):
+                        raise
+        # spilled chunks are never modified
+        chunk_index = index // buffer.chunk_size
+        if chunk_index != self._chunk_index:
+            self._chunk = buffer.load_chunk(chunk_index)
+            self._chunk_index = chunk_index
+        self._index = index + 1
+        return self._chunk[index % buffer.chunk_size]
+
+
+def memorize(collection, engine, context=None):
+    if not is_iterator(collection):
+        return collection
+    return iter(MemorizingBuffer(collection, engine, context))
+
+
+def is_standard_function(context, *names):
+    """Checks that functions with given names come from standard library.
+
+    Used to decide if well known semantics of a function may be relied on,
+    i.e. it was not overridden in the context.
+    """
+    for name in names:
+        for layer in context.collect_functions(name):
+            for spec in layer:
+                if not spec.payload.__module__.startswith(
+                        'yaql.standard_library.'):
+                    return False
+    return True
 
 
 def get_max_collection_size(engine):
@@ -183,6 +437,47 @@ def get_memory_quota(engine):
     return engine.options.get('yaql.memoryQuota', -1)
 
 
+def get_spill_threshold(engine):
+    return engine.options.get('yaql.spillThreshold', -1)
+
+
+def get_spill_partitions(engine):
+    return engine.options.get('yaql.spillPartitions', 16)
+
+
+def get_memoization_limit(engine):
+    return engine.options.get('yaql.memoizationLimit', 1024)
+
+
+class LimitedIterator(itertools.chain):
+    """Iterator over the source that raises if it has more than limit items.
+
+    Counting is done by the C-level itertools.islice, so wrapping adds almost
+    no per-item overhead. The source is not touched until the first item is
+    requested. Iterators that are already limited to at most the same number
+    of items are passed through limit_iterable() as is, so the budget of the
+    source is shared by all the functions the iterator is passed to instead
+    of stacking one wrapper per function.
+    """
+    __slots__ = ('limit',)
+
+    def __new__(cls, iterable, limit):
+        self = cls.from_iterable(cls._parts(iterable, limit))
+        self.limit = limit
+        return self
+
+    @staticmethod
+    def _parts(iterable, limit):
+        iterator = iterable if is_iterator(iterable) else iter(iterable)
+        if iter(iterator) is not iterator:
+            # re-iterable iterators like the one returned by memorize() are
+            # advanced with next() to keep their position
+            iterator = map(next, itertools.repeat(iterator))
+        yield itertools.islice(iterator, limit)
+        for _ in iterator:
+            raise exceptions.CollectionTooLargeException(limit)
+
+
 def limit_iterable(iterable, limit_or_engine):
     if isinstance(limit_or_engine, int):
         max_count = limit_or_engine
@@ -194,12 +489,10 @@ def limit_iterable(iterable, limit_or_engine):
             raise exceptions.CollectionTooLargeException(max_count)
         return iterable
 
-    def limiting_iterator():
-        for i, t in enumerate(iterable):
-            if 0 <= max_count <= i:
-                raise exceptions.CollectionTooLargeException(max_count)
-            yield t
-    return limiting_iterator()
+    if max_count < 0 or (isinstance(iterable, LimitedIterator) and
+                         iterable.limit <= max_count):
+        return iterable
+    return LimitedIterator(iterable, max_count)
 
 
 def limit_memory_usage(quota_or_engine, *args):
@@ -243,3 +536,126 @@ def filter_parameters_dict(parameters):
         if not is_keyword(name):
             del parameters[name]
     return parameters
+
+
+def sizeof(obj, depth=1):
+    """Estimates memory occupied by the object.
+
+    Shallow sizes of the object and of the objects it contains are summed
+    up to the given nesting depth. Objects below that depth are not counted
+    and objects referenced several times are counted once per reference.
+    """
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0 or isinstance(obj, (str, bytes)):
+        return size
+    if isinstance(obj, MappingType):
+        if isinstance(obj, FrozenDict):
+            size += sys.getsizeof(obj._d, 0)
+        for key, value in obj.items():
+            size += sizeof(key, depth - 1) + sizeof(value, depth - 1)
+    elif isinstance(obj, (SequenceType, SetType)):
+        for t in obj:
+            size += sizeof(t, depth - 1)
+    return size
+
+
+class MemoryAccountant:
+    """Per-evaluation estimator of memory held by growing containers.
+
+    Functions that accumulate data (sets of seen keys, group tables,
+    memorized values, queues) register their containers with track() and
+    report every added element to the returned tracker instead of calling
+    limit_memory_usage() on the whole container after each insertion.
+    Usage of all the containers tracked during the evaluation is summed up
+    and checked against yaql.memoryQuota, and the peak value is kept for
+    reporting.
+
+    Estimation is sampled: the first sample_rate elements of each container
+    and then every sample_rate-th one are measured with sizeof(), the
+    others are assumed to have the average size of the measured ones. The
+    container's own allocation is re-measured and the usage is updated with
+    each sample only. Hence for every container the estimate is off by no
+    more than the deviation of unmeasured elements from that average plus
+    the growth during the last sample_rate - 1 insertions, which is also
+    the maximum delay of detecting a quota violation. Elements are measured
+    one level deep (see sizeof()).
+    """
+
+    def __init__(self, quota_or_engine, sample_rate=16):
+        if isinstance(quota_or_engine, int):
+            self.quota = quota_or_engine
+        else:
+            self.quota = get_memory_quota(quota_or_engine)
+        self.sample_rate = sample_rate
+        self.usage = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def track(self, container):
+        return ContainerTracker(self, container)
+
+    def update(self, delta):
+        with self._lock:
+            self.usage += delta
+            usage = self.usage
+            if usage > self.peak:
+                self.peak = usage
+        if 0 < self.quota < usage:
+            raise exceptions.MemoryQuotaExceededException()
+
+    def report(self):
+        with self._lock:
+            return {
+                'quota': self.quota,
+                'usage': self.usage,
+                'peak': self.peak
+            }
+
+
+class ContainerTracker:
+    __slots__ = ('accountant', 'container', 'count', 'size',
+                 '_overhead', '_measured_count', '_measured_size')
+
+    def __init__(self, accountant, container):
+        self.accountant = accountant
+        self.container = container
+        self.count = 0
+        self.size = 0
+        self._overhead = sys.getsizeof(container, 0)
+        self._measured_count = 0
+        self._measured_size = 0
+        self._update()
+
+    def _update(self):
+        size = self._overhead
+        if self._measured_count:
+            size += self.count * self._measured_size // self._measured_count
+        delta = size - self.size
+        self.size = size
+        self.accountant.update(delta)
+
+    def add(self, item):
+        self.count += 1
+        sample_rate = self.accountant.sample_rate
+        if self.count <= sample_rate or self.count % sample_rate == 0:
+            self._measured_count += 1
+            self._measured_size += sizeof(item)
+            self._overhead = sys.getsizeof(self.container, 0)
+            self._update()
+
+    def remove(self, count=1):
+        self.count -= count
+
+    def release(self):
+        self.accountant.update(-self.size)
+        self.size = 0
+        self.count = 0
+
+
+def get_memory_accountant(context, engine):
+    accountant = None
+    if context is not None:
+        accountant = context['#memoryAccountant']
+    if accountant is None:
+        accountant = MemoryAccountant(engine)
+    return accountant
@@ -231,13 +231,96 @@ class Number(PythonType):
             validators=[lambda t: not isinstance(t, bool)])
 
 
+# standard library functions that may return different results for the
+# same arguments or depend on the environment of the process (localtz()
+# changes with the local time zone and DST)
+IMPURE_FUNCTIONS = frozenset(('random', 'now', 'localtz', 'call'))
+
+
+def _collect_function_names(expr, names):
+    if isinstance(expr, expressions.Constant):
+        return True
+    elif isinstance(expr, expressions.Wrap):
+        return _collect_function_names(expr.expr, names)
+    elif isinstance(expr, expressions.MappingRuleExpression):
+        args = (expr.source, expr.destination)
+    elif isinstance(expr, expressions.Function):
+        names.add(expr.name)
+        args = expr.args
+    else:
+        return False
+    return all(_collect_function_names(arg, names) for arg in args)
+
+
+def is_pure_expression(expr, context):
+    """Checks that the expression gives the same result for same input.
+
+    All the functions it calls must be registered in the context by the
+    standard library and not be one of IMPURE_FUNCTIONS. Thus calls of
+    methods of yaqlized objects and of functions of the host make the
+    expression impure.
+    """
+    names = set()
+    if not _collect_function_names(expr, names) or names & IMPURE_FUNCTIONS:
+        return False
+    for name in names:
+        if not context.collect_functions(name):
+            return False
+    return utils.is_standard_function(context, *names)
+
+
+def _memoization_key(value):
+    # values like 1, 1.0 and true are equal but may give different results
+    value_type = type(value)
+    if value_type is tuple or value_type is frozenset:
+        return value_type, value_type(map(_memoization_key, value))
+    elif isinstance(value, utils.MappingType):
+        return value_type, frozenset(
+            (_memoization_key(k), _memoization_key(v))
+            for k, v in value.items())
+    elif value_type is float:
+        return value_type, value.hex()
+    return value_type, value
+
+
+def _memoize(func, limit):
+    cache = collections.OrderedDict()
+    # memoization is switched off when less than 1 of 10 first calls hit
+    # the cache, as computing keys is not free
+    stats = [0, 0]
+
+    def wrapper(*args, **kwargs):
+        calls, hits = stats
+        if calls >= 256 and hits * 10 < calls:
+            return func(*args, **kwargs)
+        stats[0] = calls + 1
+        try:
+            key = _memoization_key(args), _memoization_key(kwargs)
+            result = cache.get(key, utils.NO_VALUE)
+        except TypeError:
+            # unhashable arguments
+            return func(*args, **kwargs)
+        if result is not utils.NO_VALUE:
+            stats[1] = hits + 1
+            cache.move_to_end(key)
+            return result
+        result = func(*args, **kwargs)
+        if not utils.is_iterator(result):
+            cache[key] = result
+            if len(cache) > limit:
+                cache.popitem(last=False)
+        return result
+    return wrapper
+
+
 class Lambda(LazyParameterType, SmartType):
-    __slots__ = ('with_context', 'method')
+    __slots__ = ('with_context', 'method', 'memoize')
 
-    def __init__(self, with_context=False, method=False):
+    def __init__(self, with_context=False, method=False, memoize=False):
         super().__init__(True)
         self.with_context = with_context
         self.method = method
+        self.memoize = memoize
 
     def check(self, value, context, *args, **kwargs):
         if self.method and isinstance(
@@ -290,6 +373,11 @@ class Lambda(LazyParameterType, SmartType):
             return self._call(value, new_receiver, new_context,
                               engine, args, kwargs)
 
+        if self.memoize and not self.method and not self.with_context:
+            limit = utils.get_memoization_limit(engine)
+            if limit and isinstance(value, expressions.Expression) and \
+                    is_pure_expression(value, context):
+                func = _memoize(func, limit)
         func.__unwrapped__ = value
         return func
 
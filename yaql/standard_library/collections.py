@@ -17,6 +17,7 @@ Functions that produce or consume finite collections - lists, dicts and sets.
 
 import itertools
 
+from yaql.language import asynchronous
 from yaql.language import specs
 from yaql.language import utils
 from yaql.language import yaqltypes
@@ -42,7 +43,8 @@ def list_(delegate, *args):
     """
     def rec(seq):
         for t in seq:
-            if utils.is_iterator(t):
+            # slice views stand for lazy query results here
+            if utils.is_iterator(t) or isinstance(t, utils.SliceView):
                 yield from rec(t)
             else:
                 yield t
@@ -96,6 +98,7 @@ def to_list(collection):
 
 
 @specs.parameter('args', nullable=True)
+@specs.meta(asynchronous.CONCURRENT_ARGUMENTS, True)
 @specs.name('#list')
 def build_list(engine, *args):
     """:yaql:list
@@ -118,6 +121,7 @@ def build_list(engine, *args):
 
 @specs.no_kwargs
 @specs.parameter('args', utils.MappingRule)
+@specs.meta(asynchronous.CONCURRENT_ARGUMENTS, True)
 def dict_(engine, *args):
     """:yaql:dict
 
@@ -1066,7 +1070,8 @@ def set_(delegate, *args):
     """
     def rec(seq):
         for t in seq:
-            if utils.is_iterator(t):
+            # slice views stand for lazy query results here
+            if utils.is_iterator(t) or isinstance(t, utils.SliceView):
                 yield from rec(t)
             else:
                 yield t
@@ -16,6 +16,8 @@ The module describes which operations can be done with datetime objects.
 """
 
 import datetime
+import functools
+import re
 import time as python_time
 
 from yaql.language import specs
@@ -30,6 +32,27 @@ TIMESPAN_TYPE = datetime.timedelta
 ZERO_TIMESPAN = datetime.timedelta()
 UTCTZ = yaqltypes.DateTime.utctz
 
+# ISO 8601 (RFC 3339) date with optional time and UTC offset. Such strings
+# are parsed without dateutil, which gives the same result much slower.
+_ISO_DATETIME = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)'
+    r'(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6}))?)?'
+    r'(Z|[+-]\d\d(?::?\d\d)?)?)?')
+
+# regexes used by datetime.strptime() for the format directives that are
+# parsed without it
+_FORMAT_DIRECTIVES = {
+    'd': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+    'f': r'(?P<f>[0-9]{1,6})',
+    'H': r'(?P<H>2[0-3]|[0-1]\d|\d)',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'M': r'(?P<M>[0-5]\d|\d)',
+    'S': r'(?P<S>6[0-1]|[0-5]\d|\d)',
+    'Y': r'(?P<Y>\d\d\d\d)',
+    'z': r'(?P<z>[+-]\d\d:?[0-5]\d(:?[0-5]\d(\.\d{1,6})?)?|(?-i:Z))',
+    '%': '%'
+}
+
 
 def _get_tz(offset):
     if offset is None:
@@ -111,10 +134,111 @@ def datetime_from_timestamp(timestamp, offset=ZERO_TIMESPAN):
     return DATETIME_TYPE.fromtimestamp(timestamp, tz=zone)
 
 
+def _parse_iso_datetime(string):
+    match = _ISO_DATETIME.fullmatch(string)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, offset = \
+        match.groups()
+    try:
+        result = DATETIME_TYPE(
+            int(year), int(month), int(day), int(hour or 0),
+            int(minute or 0), int(second or 0),
+            int((fraction or '0').ljust(6, '0')))
+    except ValueError:
+        # leave errors to dateutil
+        return None
+    if offset is None:
+        return result
+    minutes = 0
+    if offset != 'Z':
+        minutes = int(offset[1:3]) * 60 + int(offset[-2:] if len(
+            offset) > 3 else 0)
+        if offset[0] == '-':
+            minutes = -minutes
+    if minutes:
+        return result.replace(tzinfo=tz.tzoffset(None, minutes * 60))
+    # dateutil names zero offsets UTC and prefers the local time zone when
+    # it has the same name
+    if 'UTC' in python_time.tzname:
+        result = result.replace(tzinfo=tz.tzlocal())
+        return result if result.tzname() == 'UTC' else None
+    return result.replace(tzinfo=tz.UTC)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_format(format__):
+    """Returns regex strptime() would use for the format.
+
+    Returns None if the format has directives other than the numeric ones
+    listed in _FORMAT_DIRECTIVES.
+    """
+    parts = []
+    for token in re.findall(r'%.?|\s+|[^%\s]+', format__, re.DOTALL):
+        if token.startswith('%'):
+            pattern = _FORMAT_DIRECTIVES.get(token[1:])
+            if pattern is None:
+                return None
+            parts.append(pattern)
+        elif token.isspace():
+            parts.append(r'\s+')
+        else:
+            parts.append(re.escape(token))
+    try:
+        return re.compile(''.join(parts), re.IGNORECASE)
+    except re.error:
+        return None
+
+
+def _get_utc_offset(value):
+    if value == 'Z':
+        return ZERO_TIMESPAN
+    if len(value) not in (5, 6):
+        # offsets with seconds are left to strptime()
+        raise ValueError(value)
+    result = datetime.timedelta(
+        hours=int(value[1:3]), minutes=int(value[-2:]))
+    return -result if value[0] == '-' else result
+
+
+def _parse_formatted_datetime(string, format__):
+    regexp = _compile_format(format__)
+    if regexp is not None:
+        match = regexp.match(string)
+        if match is not None and match.end() == len(string):
+            values = match.groupdict()
+            try:
+                zone = None
+                if 'z' in values:
+                    zone = datetime.timezone(_get_utc_offset(values['z']))
+                return DATETIME_TYPE(
+                    int(values.get('Y', 1900)), int(values.get('m', 1)),
+                    int(values.get('d', 1)), int(values.get('H', 0)),
+                    int(values.get('M', 0)), int(values.get('S', 0)),
+                    int(values.get('f', '0').ljust(6, '0')), zone)
+            except ValueError:
+                # leave errors to strptime()
+                pass
+    return DATETIME_TYPE.strptime(string, format__)
+
+
+def _parse_datetime(string, format__):
+    if format__:
+        result = _parse_formatted_datetime(string, format__)
+    else:
+        result = _parse_iso_datetime(string) or parser.parse(string)
+    if not result.tzinfo:
+        return result.replace(tzinfo=UTCTZ)
+    return result
+
+
+_parse_cached_datetime = functools.lru_cache(maxsize=4096)(_parse_datetime)
+
+
 @specs.name('datetime')
 @specs.parameter('string', yaqltypes.String())
 @specs.parameter('format__', yaqltypes.String(True))
-def datetime_from_string(string, format__=None):
+def datetime_from_string(engine, string, format__=None):
     """:yaql:datetime
 
     Returns datetime object built by string parsed with format.
@@ -135,13 +259,9 @@ def datetime_from_string(string, format__=None):
         yaql> let(datetime("29.8?2015", "%d.%m?%Y"))->[$.year, $.month, $.day]
         [2015, 8, 29]
     """
-    if not format__:
-        result = parser.parse(string)
-    else:
-        result = DATETIME_TYPE.strptime(string, format__)
-    if not result.tzinfo:
-        return result.replace(tzinfo=UTCTZ)
-    return result
+    if engine.options.get('yaql.datetimeCache', False):
+        return _parse_cached_datetime(string, format__)
+    return _parse_datetime(string, format__)
 
 
 @specs.name('timespan')
@@ -19,78 +19,362 @@ Queries module.
 # yaql.standard_library.collections
 
 import collections
+import datetime
 import functools
+import heapq
+import io
 import itertools
+import pickle
+import tempfile
 
+from yaql.language import asynchronous
+from yaql.language import columnar
 from yaql.language import exceptions
+from yaql.language import expressions
+from yaql.language import parallel
 from yaql.language import specs
 from yaql.language import utils
 from yaql.language import yaqltypes
+import yaql.standard_library.common
+import yaql.standard_library.yaqlized
+
+
+_NATIVE_KEY_TYPES = frozenset((int, float, str, datetime.timedelta))
+
+# types that can be combined with Python operators the same way yaql
+# operators do it, with types of the same kind being compatible
+_NUMBER_KINDS = {int: 0, float: 0}
+_ORDERED_KINDS = {
+    int: 0, float: 0, datetime.datetime: 1, datetime.timedelta: 2
+}
+
+
+def _with_native_fast_path(func, native_func, kinds):
+    """Returns func that calls native_func for operands of the same kind.
+
+    It is used to skip yaql function resolution for the most common types
+    when combining collection elements.
+    """
+    def wrapper(a, b):
+        kind = kinds.get(type(a))
+        if kind is not None and kind == kinds.get(type(b)):
+            return native_func(a, b)
+        return func(a, b)
+    return wrapper
+
+
+def _native_add(a, b):
+    return a + b
+
+
+def _native_max(a, b):
+    # matches max(a, b) from the math module
+    return b if b > a else a
+
+
+def _native_min(a, b):
+    # matches min(a, b) from the math module
+    return a if b > a else b
+
+
+def _get_sum_function(operator, context):
+    if utils.is_standard_function(context, '#operator_+'):
+        return _with_native_fast_path(operator, _native_add, _NUMBER_KINDS)
+    return operator
+
+
+def _get_sum_accumulator(operator, context):
+    if utils.is_standard_function(context, '#operator_+'):
+        return SumAccumulator(
+            _with_native_fast_path(operator, _native_add, _NUMBER_KINDS))
+    return ReduceAccumulator(operator)
+
+
+def _reduce(accumulator, collection, seed=utils.NO_VALUE):
+    """Same as functools.reduce() but folds values with the accumulator."""
+    if seed is not utils.NO_VALUE:
+        accumulator.add(seed)
+    for t in collection:
+        accumulator.add(t)
+    if accumulator.value is utils.NO_VALUE:
+        raise TypeError('reduce() of empty iterable with no initial value')
+    return accumulator.result()
+
+
+def _get_max_function(func, context):
+    if utils.is_standard_function(context, 'max', '#operator_>'):
+        return _with_native_fast_path(func, _native_max, _ORDERED_KINDS)
+    return func
+
+
+def _get_min_function(func, context):
+    if utils.is_standard_function(context, 'min', '#operator_>'):
+        return _with_native_fast_path(func, _native_min, _ORDERED_KINDS)
+    return func
+
+
+class _SortedRuns:
+    """Sorted runs of (keys, element) rows for the external merge sort.
+
+    Spilled runs are pickled to an anonymous temporary file, created on the
+    first spill, in chunks of chunk_size rows, so merging them holds one
+    chunk per run in memory. The last run, a run that cannot be pickled and
+    all the runs following it are kept in memory.
+    """
+
+    def __init__(self, chunk_size=32):
+        self.chunk_size = chunk_size
+        self.spilling = True
+        self._file = None
+        self._runs = []
+
+    def add(self, rows, spill=True):
+        if spill and self.spilling:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile()
+            positions = []
+            try:
+                for i in range(0, len(rows), self.chunk_size):
+                    self._file.seek(0, io.SEEK_END)
+                    positions.append(self._file.tell())
+                    pickle.dump(rows[i:i + self.chunk_size], self._file,
+                                pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                self.spilling = False
+            else:
+                self._runs.append((positions, None))
+                return
+        self._runs.append((None, rows))
+
+    def _read(self, run):
+        positions, rows = run
+        if rows is not None:
+            yield from rows
+            return
+        for position in positions:
+            self._file.seek(position)
+            yield from pickle.load(self._file)
+
+    def __len__(self):
+        return len(self._runs)
+
+    def merge(self, key):
+        return heapq.merge(*map(self._read, self._runs), key=key)
+
+
+class _HashPartitions:
+    """Rows distributed by hash of their keys to spilled partitions.
+
+    Rows of each partition are buffered and pickled to an anonymous
+    temporary file in chunks of chunk_size rows. Rows of a partition are
+    read back in the order they were added. A partition that cannot be
+    pickled is kept in memory.
+    """
+
+    def __init__(self, count, chunk_size=64):
+        self.count = max(1, count)
+        self.chunk_size = chunk_size
+        self._file = tempfile.TemporaryFile()
+        self._positions = [[] for _ in range(self.count)]
+        self._buffers = [[] for _ in range(self.count)]
+        self._spilling = [True] * self.count
+
+    def add(self, key, row):
+        index = hash(key) % self.count
+        buffer = self._buffers[index]
+        buffer.append(row)
+        if self._spilling[index] and len(buffer) >= self.chunk_size:
+            self._flush(index)
+
+    def _flush(self, index):
+        self._file.seek(0, io.SEEK_END)
+        position = self._file.tell()
+        try:
+            pickle.dump(self._buffers[index], self._file,
+                        pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._spilling[index] = False
+            self._file.truncate(position)
+        else:
+            self._positions[index].append(position)
+            self._buffers[index] = []
+
+    def _read(self, index):
+        positions = self._positions[index]
+        self._positions[index] = []
+        for position in positions:
+            self._file.seek(position)
+            yield from pickle.load(self._file)
+        buffer = self._buffers[index]
+        self._buffers[index] = []
+        yield from buffer
+
+    def __iter__(self):
+        """Yields iterators over rows of each partition one by one."""
+        try:
+            for index in range(self.count):
+                yield self._read(index)
+        finally:
+            self._file.close()
 
 
 class OrderingIterable(utils.IterableType):
-    def __init__(self, collection, operator_lt, operator_gt):
+    def __init__(self, collection, operator_lt, operator_gt, engine=None,
+                 context=None):
         self.collection = collection
         self.operator_lt = operator_lt
         self.operator_gt = operator_gt
+        self.engine = engine
+        self.context = context
         self.order = []
         self.sorted = None
+        self.runs = None
 
     def append_field(self, selector, is_ascending):
         self.order.append((selector, is_ascending))
 
     def __iter__(self):
-        if self.sorted is None:
+        if self.sorted is None and self.runs is None:
             self.do_sort()
+        if self.runs is not None:
+            compare = functools.cmp_to_key(self.compare_keys)
+            return (t for _, t in self.runs.merge(
+                key=lambda row: compare(row[0])))
         return iter(self.sorted)
 
-    def do_sort(outer_self):
-        class Comparator:
-            @staticmethod
-            def compare(left, right):
-                result = 0
-                for t in outer_self.order:
-                    a = t[0](left)
-                    b = t[0](right)
-                    if outer_self.operator_lt(a, b):
-                        result = -1
-                    elif outer_self.operator_gt(a, b):
-                        result = 1
-                    else:
-                        continue
-                    if not t[1]:
-                        result *= -1
-                    break
-                return result
-
-            def __init__(self, obj):
-                self.obj = obj
-
-            def __lt__(self, other):
-                return self.compare(self.obj, other.obj) < 0
-
-            def __gt__(self, other):
-                return self.compare(self.obj, other.obj) > 0
+    @staticmethod
+    def _is_natively_ordered(keys):
+        """Checks if keys can be sorted with Python comparison.
 
-            def __eq__(self, other):
-                return self.compare(self.obj, other.obj) == 0
-
-            def __le__(self, other):
-                return self.compare(self.obj, other.obj) <= 0
+        That is the case when all the keys are numbers, strings, timespans or
+        datetimes of the same kind, for which Python ordering matches the
+        one of yaql comparison operators.
+        """
+        key_type = None
+        for key in keys:
+            t = type(key)
+            if t is int or t is float:
+                if key != key:
+                    return False
+                t = int
+            elif t is datetime.datetime:
+                t = (t, key.tzinfo is None)
+            elif t is not str and t is not datetime.timedelta:
+                return False
+            if key_type is None:
+                key_type = t
+            elif key_type != t:
+                return False
+        return True
+
+    def compare_keys(self, left, right):
+        for a, b, (_, is_ascending) in zip(left, right, self.order):
+            if type(a) is type(b) and type(a) in _NATIVE_KEY_TYPES:
+                if a < b:
+                    result = -1
+                elif a > b:
+                    result = 1
+                else:
+                    continue
+            elif self.operator_lt(a, b):
+                result = -1
+            elif self.operator_gt(a, b):
+                result = 1
+            else:
+                continue
+            return result if is_ascending else -result
+        return 0
 
-            def __ge__(self, other):
-                return self.compare(self.obj, other.obj) >= 0
+    def top(self, count):
+        """Iterates over the first count elements of the ordered collection.
 
-            def __ne__(self, other):
-                return self.compare(self.obj, other.obj) != 0
+        Unlike full sort, only count elements are kept in memory during the
+        selection which is done with a bounded heap. The result is the same
+        as of taking first count elements of the sorted collection. Once the
+        collection was sorted, it is not consumed again and the elements are
+        taken from the sort result or merged from the spilled runs.
+        """
+        if self.sorted is not None:
+            yield from self.sorted[:count]
+            return
+        if self.runs is not None:
+            yield from itertools.islice(self, count)
+            return
+        compare = functools.cmp_to_key(self.compare_keys)
+        keyed = (
+            (tuple(selector(t) for selector, _ in self.order), t)
+            for t in self.collection
+        )
+        for _, t in heapq.nsmallest(
+                count, keyed, key=lambda row: compare(row[0])):
+            yield t
 
-        outer_self.sorted = sorted(outer_self.collection, key=Comparator)
+    def _sort_indexes(self, columns, count):
+        indexes = list(range(count))
+        if all(map(self._is_natively_ordered, columns)):
+            # stable sorting by each key starting from the least significant
+            # one gives the same order as the lexicographical comparison
+            for column, (_, is_ascending) in reversed(
+                    list(zip(columns, self.order))):
+                indexes.sort(key=column.__getitem__,
+                             reverse=not is_ascending)
+        else:
+            rows = list(zip(*columns))
+            compare = functools.cmp_to_key(self.compare_keys)
+            indexes.sort(key=lambda i: compare(rows[i]))
+        return indexes
+
+    def do_sort(self):
+        threshold = -1 if self.engine is None \
+            else utils.get_spill_threshold(self.engine)
+        if threshold < 0:
+            items = list(self.collection)
+            columns = [
+                [selector(t) for t in items] for selector, _ in self.order
+            ]
+            self.sorted = [
+                items[i] for i in self._sort_indexes(columns, len(items))]
+        else:
+            self._external_sort(threshold)
+
+    def _external_sort(self, threshold):
+        # elements are collected into runs until their estimated size
+        # exceeds the threshold, every full run is sorted and spilled to
+        # disk, and then runs are merged on iteration with the last one that
+        # is kept in memory. Collections that fit into a single run are
+        # sorted in memory and keep their elements
+        accountant = utils.get_memory_accountant(self.context, self.engine)
+        runs = _SortedRuns()
+        rows = []
+        tracker = accountant.track(rows)
+        for t in self.collection:
+            rows.append((tuple(selector(t) for selector, _ in self.order), t))
+            tracker.add(t)
+            if (runs.spilling and tracker.size > threshold and
+                    len(rows) >= runs.chunk_size):
+                runs.add(self._sort_run(rows))
+                tracker.release()
+                rows = []
+                tracker = accountant.track(rows)
+        tracker.release()
+        if not runs:
+            self.sorted = [t for _, t in self._sort_run(rows)]
+            return
+        if rows:
+            runs.add(self._sort_run(rows), spill=False)
+        self.runs = runs
+
+    def _sort_run(self, rows):
+        columns = [
+            [row[0][i] for row in rows] for i in range(len(self.order))
+        ]
+        return [rows[i] for i in self._sort_indexes(columns, len(rows))]
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.parameter('predicate', yaqltypes.Lambda())
 @specs.method
-def where(collection, predicate):
+def where(engine, collection, predicate):
     """:yaql:where
 
     Returns only those collection elements, for which the filtering query
@@ -108,13 +392,42 @@ def where(collection, predicate):
         yaql> [1, 2, 3, 4, 5].where($ > 3)
         [4, 5]
     """
+    if columnar.is_enabled(engine) and isinstance(
+            collection, utils.SequenceType):
+        return columnar.ColumnarQuery(collection).where(predicate)
     return filter(predicate, collection)
 
 
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.parameter('predicate', yaqltypes.Lambda())
+@specs.name('where')
+@specs.method
+def where_columnar(collection, predicate):
+    """:yaql:where
+
+    Returns only those query results, for which the filtering query
+    (predicate) is true. Used when yaql.columnar option is enabled to keep
+    the query in a form that can be evaluated on columns.
+
+    :signature: collection.where(predicate)
+    :receiverArg collection: query to be filtered
+    :argType collection: columnar query
+    :arg predicate: filter for collection elements
+    :argType predicate: lambda
+    :returnType: columnar query
+
+    .. code::
+
+        yaql> [{a => 1}, {a => 5}].where($.a > 3)
+        [{"a": 5}]
+    """
+    return collection.where(predicate)
+
+
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.parameter('selector', yaqltypes.Lambda())
 @specs.method
-def select(collection, selector):
+def select(engine, context, collection, selector):
     """:yaql:select
 
     Applies the selector to every item of the collection and returns a list of
@@ -134,7 +447,123 @@ def select(collection, selector):
         yaql> [{'a'=> 2}, {'a'=> 4}].select($.a)
         [2, 4]
     """
-    return map(selector, collection)
+    if columnar.is_enabled(engine) and isinstance(
+            collection, utils.SequenceType):
+        return columnar.ColumnarQuery(collection).select(selector)
+    bridge = asynchronous.get_bridge(context)
+    if bridge is not None:
+        return bridge.map(selector, collection)
+    return yaql.standard_library.yaqlized.map_concurrently(
+        selector, collection)
+
+
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.parameter('selector', yaqltypes.Lambda())
+@specs.name('select')
+@specs.method
+def select_columnar(collection, selector):
+    """:yaql:select
+
+    Applies the selector to every query result. Used when yaql.columnar
+    option is enabled to keep the query in a form that can be evaluated on
+    columns.
+
+    :signature: collection.select(selector)
+    :receiverArg collection: input query
+    :argType collection: columnar query
+    :arg selector: expression for processing elements
+    :argType selector: lambda
+    :returnType: columnar query
+
+    .. code::
+
+        yaql> [{a => 2}, {a => 4}].where($.a > 3).select($.a * 2)
+        [8]
+    """
+    return collection.select(selector)
+
+
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('predicate', yaqltypes.Lambda())
+@specs.parameter('chunk_size', int)
+@specs.parameter('ordered', bool)
+@specs.method
+def parallel_where(engine, context, collection, predicate, chunk_size=256,
+                   ordered=True):
+    """:yaql:parallelWhere
+
+    Returns only those collection elements, for which the filtering query
+    (predicate) is true. The predicate is evaluated in a pool of worker
+    processes, chunkSize elements at a time. The predicate may only use
+    functions of the default standard library context and context values
+    that can be pickled, otherwise it is evaluated in the current process as
+    by where.
+
+    :signature: collection.parallelWhere(predicate, chunkSize => 256,
+                                         ordered => true)
+    :receiverArg collection: collection to be filtered
+    :argType collection: iterable
+    :arg predicate: filter for collection elements
+    :argType predicate: lambda
+    :arg chunkSize: number of elements sent to a worker at once
+    :argType chunkSize: integer
+    :arg ordered: whether to keep the order of the elements. If false,
+        elements are returned as soon as their chunk is evaluated
+    :argType ordered: boolean
+    :returnType: iterable
+
+    .. code::
+
+        yaql> [1, 2, 3, 4, 5].parallelWhere($ > 3)
+        [4, 5]
+    """
+    payload = parallel.prepare_lambda(predicate, context)
+    if payload is None:
+        return filter(predicate, collection)
+    return (item for item, result in parallel.evaluate(
+        collection, predicate, payload, engine, context, max(chunk_size, 1),
+        ordered, True) if result)
+
+
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('selector', yaqltypes.Lambda())
+@specs.parameter('chunk_size', int)
+@specs.parameter('ordered', bool)
+@specs.method
+def parallel_select(engine, context, collection, selector, chunk_size=256,
+                    ordered=True):
+    """:yaql:parallelSelect
+
+    Applies the selector to every item of the collection and returns a list of
+    results. The selector is evaluated in a pool of worker processes,
+    chunkSize elements at a time. The selector may only use functions of the
+    default standard library context and context values that can be pickled,
+    otherwise it is evaluated in the current process as by select.
+
+    :signature: collection.parallelSelect(selector, chunkSize => 256,
+                                          ordered => true)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg selector: expression for processing elements
+    :argType selector: lambda
+    :arg chunkSize: number of elements sent to a worker at once
+    :argType chunkSize: integer
+    :arg ordered: whether to keep the order of the results. If false,
+        results are returned as soon as their chunk is evaluated
+    :argType ordered: boolean
+    :returnType: iterable
+
+    .. code::
+
+        yaql> [1, 2, 3, 4, 5].parallelSelect($ * $)
+        [1, 4, 9, 16, 25]
+    """
+    payload = parallel.prepare_lambda(selector, context)
+    if payload is None:
+        return map(selector, collection)
+    return (result for _, result in parallel.evaluate(
+        collection, selector, payload, engine, context, max(chunk_size, 1),
+        ordered, False))
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
@@ -183,6 +612,8 @@ def skip(collection, count):
         yaql> [1, 2, 3, 4, 5].skip(2)
         [3, 4, 5]
     """
+    if isinstance(collection, utils.SequenceType) and count >= 0:
+        return utils.slice_sequence(collection, count)
     return itertools.islice(collection, count, None)
 
 
@@ -207,9 +638,40 @@ def limit(collection, count):
         yaql> [1, 2, 3, 4, 5].limit(4)
         [1, 2, 3, 4]
     """
+    if isinstance(collection, utils.SequenceType) and count >= 0:
+        return utils.slice_sequence(collection, 0, count)
     return itertools.islice(collection, count)
 
 
+@specs.parameter('collection', OrderingIterable)
+@specs.parameter('count', int, nullable=False)
+@specs.name('limit')
+@specs.method
+def limit_ordered(collection, count):
+    """:yaql:limit
+
+    Returns the first count elements of an ordered collection. Only count
+    elements are kept during the selection instead of sorting the whole
+    collection.
+
+    :signature: collection.limit(count)
+    :receiverArg collection: collection ordered with orderBy or
+        orderByDescending
+    :argType collection: ordered iterable
+    :arg count: how many first elements of a collection to return
+    :argType count: integer
+    :returnType: iterable
+
+    .. code::
+
+        yaql> [3, 5, 1, 4, 2].orderBy($).limit(2)
+        [1, 2]
+    """
+    if count < 0:
+        return limit(collection, count)
+    return collection.top(count)
+
+
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.extension_method
 def append(collection, *args):
@@ -234,13 +696,17 @@ def append(collection, *args):
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
-@specs.parameter('key_selector', yaqltypes.Lambda())
+@specs.parameter('key_selector', yaqltypes.Lambda(memoize=True))
 @specs.extension_method
-def distinct(engine, collection, key_selector=None):
+def distinct(engine, context, collection, key_selector=None):
     """:yaql:distinct
 
     Returns only unique members of the collection. If keySelector is
-    specified, it is used to determine uniqueness.
+    specified, it is used to determine uniqueness. Elements are returned in
+    the order of their first occurrence unless the estimated size of the
+    keys exceeds yaql.spillThreshold. Then the elements with keys not seen
+    by that moment are spilled to yaql.spillPartitions partitions by hash of
+    their keys and returned afterwards, partition by partition.
 
     :signature: collection.distinct(keySelector => null)
     :receiverArg collection: input collection
@@ -260,13 +726,42 @@ def distinct(engine, collection, key_selector=None):
         yaql> [['a', 1], ['b', 2], ['c', 1], ['a', 3]].distinct($[1])
         [['a', 1], ['b', 2], ['a', 3]]
     """
+    threshold = utils.get_spill_threshold(engine)
+    accountant = utils.get_memory_accountant(context, engine)
     distinct_values = set()
-    for t in collection:
-        key = t if key_selector is None else key_selector(t)
-        if key not in distinct_values:
+    tracker = accountant.track(distinct_values)
+    partitions = None
+    try:
+        for t in collection:
+            key = t if key_selector is None else key_selector(t)
+            if key in distinct_values:
+                continue
+            if partitions is not None:
+                partitions.add(key, (key, t))
+                continue
             distinct_values.add(key)
-            utils.limit_memory_usage(engine, (1, distinct_values))
+            tracker.add(key)
             yield t
+            if 0 <= threshold < tracker.size:
+                # keys seen so far stay in memory, elements with new keys
+                # are spilled and deduplicated one partition at a time
+                partitions = _HashPartitions(
+                    utils.get_spill_partitions(engine))
+        if partitions is None:
+            return
+        tracker.release()
+        distinct_values = set()
+        for partition in partitions:
+            tracker = accountant.track(distinct_values)
+            for key, t in partition:
+                if key not in distinct_values:
+                    distinct_values.add(key)
+                    tracker.add(key)
+                    yield t
+            tracker.release()
+            distinct_values.clear()
+    finally:
+        tracker.release()
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
@@ -425,12 +920,39 @@ def count(collection):
         yaql> [1, 2].count()
         2
     """
+    if isinstance(collection, utils.SequenceType):
+        return len(collection)
     return count_(collection)
 
 
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.name('count')
+@specs.method
+def count_columnar(context, collection):
+    """:yaql:count
+
+    Returns the number of query results evaluating the query on columns
+    when possible.
+
+    :signature: collection.count()
+    :receiverArg collection: input query
+    :argType collection: columnar query
+    :returnType: integer
+
+    .. code::
+
+        yaql> [{a => 2}, {a => 4}].where($.a > 3).count()
+        1
+    """
+    result = collection.count(context)
+    if result is utils.NO_VALUE:
+        result = count_(collection)
+    return result
+
+
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.method
-def memorize(collection, engine):
+def memorize(collection, engine, context):
     """:yaql:memorize
 
     Returns an iterator over collection and memorizes already iterated values.
@@ -450,13 +972,13 @@ def memorize(collection, engine):
         yaql> let(range(4).memorize()) -> $.sum() + $.len()
         10
     """
-    return utils.memorize(collection, engine)
+    return utils.memorize(collection, engine, context)
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.inject('operator', yaqltypes.Delegate('#operator_+'))
 @specs.method
-def sum_(operator, collection, initial=utils.NO_VALUE):
+def sum_(context, operator, collection, initial=utils.NO_VALUE):
     """:yaql:sum
 
     Returns the sum of values in a collection starting from initial if
@@ -476,13 +998,43 @@ def sum_(operator, collection, initial=utils.NO_VALUE):
         yaql> ['a', 'b'].sum('c')
         "cab"
     """
-    return aggregate(collection, operator, initial)
+    return _reduce(
+        _get_sum_accumulator(operator, context), collection, initial)
+
+
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.inject('operator', yaqltypes.Delegate('#operator_+'))
+@specs.name('sum')
+@specs.method
+def sum_columnar(context, operator, collection, initial=utils.NO_VALUE):
+    """:yaql:sum
+
+    Returns sum value of query results evaluating the query on columns
+    when possible. Considers initial if specified.
+
+    :signature: collection.sum(initial => NoValue)
+    :receiverArg collection: input query
+    :argType collection: columnar query
+    :arg initial: value to start with. NoValue by default
+    :argType initial: query elements type
+    :returnType: query elements type
+
+    .. code::
+
+        yaql> [{a => 2}, {a => 4}].select($.a).sum()
+        6
+    """
+    if initial is utils.NO_VALUE:
+        result = collection.sum(context)
+        if result is not utils.NO_VALUE:
+            return result
+    return sum_(context, operator, collection, initial)
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.inject('func', yaqltypes.Delegate('max'))
 @specs.method
-def max_(func, collection, initial=utils.NO_VALUE):
+def max_(context, func, collection, initial=utils.NO_VALUE):
     """:yaql:max
 
     Returns max value in collection. Considers initial if specified.
@@ -499,13 +1051,43 @@ def max_(func, collection, initial=utils.NO_VALUE):
         yaql> [3, 1, 2].max()
         3
     """
-    return aggregate(collection, func, initial)
+    return aggregate(
+        context, collection, _get_max_function(func, context), initial)
+
+
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.inject('func', yaqltypes.Delegate('max'))
+@specs.name('max')
+@specs.method
+def max_columnar(context, func, collection, initial=utils.NO_VALUE):
+    """:yaql:max
+
+    Returns max value of query results evaluating the query on columns
+    when possible. Considers initial if specified.
+
+    :signature: collection.max(initial => NoValue)
+    :receiverArg collection: input query
+    :argType collection: columnar query
+    :arg initial: value to start with. NoValue by default
+    :argType initial: query elements type
+    :returnType: query elements type
+
+    .. code::
+
+        yaql> [{a => 2}, {a => 4}].select($.a).max()
+        4
+    """
+    if initial is utils.NO_VALUE:
+        result = collection.max(context)
+        if result is not utils.NO_VALUE:
+            return result
+    return max_(context, func, collection, initial)
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.inject('func', yaqltypes.Delegate('min'))
 @specs.method
-def min_(func, collection, initial=utils.NO_VALUE):
+def min_(context, func, collection, initial=utils.NO_VALUE):
     """:yaql:min
 
     Returns min value in collection. Considers initial if specified.
@@ -522,7 +1104,69 @@ def min_(func, collection, initial=utils.NO_VALUE):
         yaql> [3, 1, 2].min()
         1
     """
-    return aggregate(collection, func, initial)
+    return aggregate(
+        context, collection, _get_min_function(func, context), initial)
+
+
+@specs.parameter('collection', columnar.ColumnarQuery)
+@specs.inject('func', yaqltypes.Delegate('min'))
+@specs.name('min')
+@specs.method
+def min_columnar(context, func, collection, initial=utils.NO_VALUE):
+    """:yaql:min
+
+    Returns min value of query results evaluating the query on columns
+    when possible. Considers initial if specified.
+
+    :signature: collection.min(initial => NoValue)
+    :receiverArg collection: input query
+    :argType collection: columnar query
+    :arg initial: value to start with. NoValue by default
+    :argType initial: query elements type
+    :returnType: query elements type
+
+    .. code::
+
+        yaql> [{a => 2}, {a => 4}].select($.a).min()
+        2
+    """
+    if initial is utils.NO_VALUE:
+        result = collection.min(context)
+        if result is not utils.NO_VALUE:
+            return result
+    return min_(context, func, collection, initial)
+
+
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.inject('operator', yaqltypes.Delegate('#operator_+'))
+@specs.method
+def avg(context, operator, collection):
+    """:yaql:avg
+
+    Returns the arithmetic mean of values in a collection or null if the
+    collection is empty. Values are summed up the same way as by sum() in
+    a single pass over the collection. The sum is divided by the number of
+    values with true division, so the mean of integers is a float even if
+    it is whole, unlike $.sum() / $.len() which floor-divides integers.
+
+    :signature: collection.avg()
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :returnType: float
+
+    .. code::
+
+        yaql> [3, 1, 2, 4].avg()
+        2.5
+        yaql> [1, 3].avg()
+        2.0
+    """
+    accumulator = AverageAccumulator(_get_sum_function(operator, context))
+    for t in collection:
+        accumulator.add(t)
+    if accumulator.count == 0:
+        return None
+    return accumulator.result()
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
@@ -556,6 +1200,34 @@ def first(collection, default=utils.NO_VALUE):
         return default
 
 
+@specs.parameter('collection', OrderingIterable)
+@specs.parameter('default', nullable=True)
+@specs.name('first')
+@specs.method
+def first_ordered(collection, default=utils.NO_VALUE):
+    """:yaql:first
+
+    Returns the first element of an ordered collection without sorting the
+    whole collection. If the collection is empty, returns the default value or
+    raises StopIteration if default is not specified.
+
+    :signature: collection.first(default => NoValue)
+    :receiverArg collection: collection ordered with orderBy or
+        orderByDescending
+    :argType collection: ordered iterable
+    :arg default: value to be returned if collection is empty. NoValue by
+        default
+    :argType default: any
+    :returnType: type of collection's elements or default value type
+
+    .. code::
+
+        yaql> [3, 1, 2].orderBy($).first()
+        1
+    """
+    return first(collection.top(1), default)
+
+
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.method
 def single(collection):
@@ -729,11 +1401,11 @@ def sequence(start=0, step=1):
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
-@specs.parameter('selector', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda(memoize=True))
 @specs.inject('operator_gt', yaqltypes.Delegate('#operator_>'))
 @specs.inject('operator_lt', yaqltypes.Delegate('#operator_<'))
 @specs.method
-def order_by(collection, selector, operator_lt, operator_gt):
+def order_by(engine, context, collection, selector, operator_lt, operator_gt):
     """:yaql:orderBy
 
     Returns an iterator over collection elements sorted in ascending order.
@@ -753,17 +1425,19 @@ def order_by(collection, selector, operator_lt, operator_gt):
         yaql> [[1, 'c'], [2, 'b'], [3, 'c'], [0, 'd']].orderBy($[1])
         [[2, 'b'], [1, 'c'], [3, 'c'], [0, 'd']]
     """
-    oi = OrderingIterable(collection, operator_lt, operator_gt)
+    oi = OrderingIterable(
+        collection, operator_lt, operator_gt, engine, context)
     oi.append_field(selector, True)
     return oi
 
 
 @specs.parameter('collection', yaqltypes.Iterable())
-@specs.parameter('selector', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda(memoize=True))
 @specs.inject('operator_gt', yaqltypes.Delegate('#operator_>'))
 @specs.inject('operator_lt', yaqltypes.Delegate('#operator_<'))
 @specs.method
-def order_by_descending(collection, selector, operator_lt, operator_gt):
+def order_by_descending(engine, context, collection, selector, operator_lt,
+                        operator_gt):
     """:yaql:orderByDescending
 
     Returns an iterator over collection elements sorted in descending order.
@@ -783,13 +1457,14 @@ def order_by_descending(collection, selector, operator_lt, operator_gt):
         yaql> [4, 2, 3, 1].orderByDescending($)
         [4, 3, 2, 1]
     """
-    oi = OrderingIterable(collection, operator_lt, operator_gt)
+    oi = OrderingIterable(
+        collection, operator_lt, operator_gt, engine, context)
     oi.append_field(selector, False)
     return oi
 
 
 @specs.parameter('collection', OrderingIterable)
-@specs.parameter('selector', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda(memoize=True))
 @specs.method
 def then_by(collection, selector, context):
     """:yaql:thenBy
@@ -817,7 +1492,7 @@ def then_by(collection, selector, context):
 
 
 @specs.parameter('collection', OrderingIterable)
-@specs.parameter('selector', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda(memoize=True))
 @specs.method
 def then_by_descending(collection, selector, context):
     """:yaql:thenByDescending
@@ -906,20 +1581,324 @@ class GroupAggregator:
         raise self._failure_info
 
 
+class CountAccumulator:
+    """Incremental groupBy aggregator counting the group values."""
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        return False
+
+    def result(self):
+        return self.count
+
+
+class ReduceAccumulator:
+    """Incremental groupBy aggregator folding the group values with func.
+
+    Gives the same result as aggregate() of the group value list without
+    initial value and is used for sum, min and max.
+    """
+    __slots__ = ('func', 'value')
+
+    def __init__(self, func):
+        self.func = func
+        self.value = utils.NO_VALUE
+
+    def add(self, value):
+        if self.value is utils.NO_VALUE:
+            self.value = value
+        else:
+            self.value = self.func(self.value, value)
+        return False
+
+    def result(self):
+        return self.value
+
+
+class SumAccumulator(ReduceAccumulator):
+    """Incremental aggregator adding up values with the standard operator +.
+
+    Consecutive strings are collected and joined at once when the result
+    is needed, so adding up n strings takes linear rather than quadratic
+    time. Values of other types are folded with func.
+    """
+    __slots__ = ('strings',)
+
+    def __init__(self, func):
+        super().__init__(func)
+        self.strings = []
+
+    def add(self, value):
+        if type(value) is str and (
+                self.strings or type(self.value) is str):
+            if not self.strings:
+                self.strings.append(self.value)
+            self.strings.append(value)
+            return False
+        self._join()
+        return super().add(value)
+
+    def _join(self):
+        if self.strings:
+            self.value = ''.join(self.strings)
+            self.strings = []
+
+    def result(self):
+        self._join()
+        return self.value
+
+
+class AverageAccumulator(ReduceAccumulator):
+    """Incremental groupBy aggregator computing mean of the group values.
+
+    The mean is computed with true division as by avg().
+    """
+    __slots__ = ('count',)
+
+    def __init__(self, func):
+        super().__init__(func)
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        return super().add(value)
+
+    def result(self):
+        return self.value / self.count
+
+
+class FirstAccumulator:
+    """Incremental groupBy aggregator returning the first group value."""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = utils.NO_VALUE
+
+    def add(self, value):
+        if self.value is utils.NO_VALUE:
+            self.value = value
+        return False
+
+    def result(self):
+        return self.value
+
+
+class LastAccumulator(FirstAccumulator):
+    """Incremental groupBy aggregator returning the last group value."""
+    __slots__ = ()
+
+    def add(self, value):
+        self.value = value
+        return False
+
+
+class DistinctCountAccumulator:
+    """Incremental groupBy aggregator counting distinct group values.
+
+    Unlike other accumulators it keeps the distinct values, so add() returns
+    true when the value was retained.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = set()
+
+    def add(self, value):
+        if value in self.values:
+            return False
+        self.values.add(value)
+        return True
+
+    def result(self):
+        return len(self.values)
+
+
+def _delegate(name, engine, context):
+    return context.create_child_context()(name, engine)
+
+
+def _sum_accumulators(engine, context):
+    operator = _delegate('#operator_+', engine, context)
+    return lambda: _get_sum_accumulator(operator, context)
+
+
+def _reduce_accumulators(name, get_function):
+    def factory(engine, context):
+        func = get_function(_delegate(name, engine, context), context)
+        return lambda: ReduceAccumulator(func)
+    return factory
+
+
+def _average_accumulators(engine, context):
+    func = _get_sum_function(
+        _delegate('#operator_+', engine, context), context)
+    return lambda: AverageAccumulator(func)
+
+
+# factories of groupBy accumulators by aggregator name, the functions and
+# operators they use are resolved once per groupBy call
+_GROUP_ACCUMULATORS = {
+    'count': lambda engine, context: CountAccumulator,
+    'sum': _sum_accumulators,
+    'min': _reduce_accumulators('min', _get_min_function),
+    'max': _reduce_accumulators('max', _get_max_function),
+    'avg': _average_accumulators,
+    'first': lambda engine, context: FirstAccumulator,
+    'last': lambda engine, context: LastAccumulator,
+    'distinctCount': lambda engine, context: DistinctCountAccumulator,
+}
+
+
+def _is_group_list(expr):
+    return isinstance(expr, expressions.GetContextValue) and \
+        expr.path.value in ('$', '$1')
+
+
+def _get_aggregator_call(expr):
+    """Returns name of the function applied to $ as a whole by expr.
+
+    Understands $.name(), name($) and their combination with distinct().
+    """
+    if isinstance(expr, expressions.BinaryOperator) and \
+            expr.name == '#operator_.':
+        receiver, func = expr.args
+        if type(func) is not expressions.Function or func.args:
+            return None
+    elif type(expr) is expressions.Function and len(expr.args) == 1:
+        receiver, func = expr.args[0], expr
+    else:
+        return None
+    if _is_group_list(receiver):
+        return func.name
+    elif func.name in ('count', 'len') and \
+            _get_aggregator_call(receiver) == 'distinct':
+        return 'distinctCount'
+    return None
+
+
+def get_group_accumulator_factory(aggregator, engine, context):
+    """Returns factory of incremental aggregators equivalent to aggregator.
+
+    Aggregator can be either one of the count, sum, min, max, avg, first,
+    last or distinctCount keywords, which stand for the same function applied
+    to the group (distinct().count() for distinctCount), or an expression
+    applying standard count(), len(), sum(), min(), max(), avg(), first(),
+    last() or distinct().count() to the group. None is returned for all other
+    aggregators and when the function is not the standard one in context.
+    """
+    expr = getattr(aggregator, '__unwrapped__', None)
+    if isinstance(expr, expressions.KeywordConstant):
+        name = expr.value
+    else:
+        name = _get_aggregator_call(expr)
+    factory = _GROUP_ACCUMULATORS.get('count' if name == 'len' else name)
+    if factory is None:
+        return None
+    used_functions = ['count', 'distinct'] \
+        if name == 'distinctCount' else [name]
+    if not utils.is_standard_function(context, *used_functions):
+        return None
+    return factory(engine, context)
+
+
+def _add_to_accumulator(accumulator, value):
+    return accumulator.add(value)
+
+
+def _add_to_list(group, value):
+    group.append(value)
+    return True
+
+
+def _group(engine, context, collection, key_selector, value_selector,
+           group_factory, add, spill_groups):
+    """Groups collection elements yielding (key, group) pairs.
+
+    Groups are returned in the order of the first occurrence of their keys
+    until the estimated size of the groups exceeds yaql.spillThreshold.
+    Then elements with keys of groups that are not in memory are spilled to
+    yaql.spillPartitions partitions by hash of the key and grouped one
+    partition at a time after the groups held in memory are returned. If
+    spill_groups is true, groups held in memory are spilled too, so that
+    only the groups of one partition are in memory at a time.
+    """
+    threshold = utils.get_spill_threshold(engine)
+    accountant = utils.get_memory_accountant(context, engine)
+    groups = {}
+    tracker = accountant.track(groups)
+    partitions = None
+    for t in collection:
+        value = t if value_selector is None else value_selector(t)
+        key = key_selector(t)
+        group = groups.get(key)
+        if group is None:
+            if partitions is not None:
+                partitions.add(key, (key, value))
+                continue
+            groups[key] = group = group_factory()
+            tracker.add(group)
+        if add(group, value):
+            tracker.add(value)
+        if partitions is None and 0 <= threshold < tracker.size:
+            partitions = _HashPartitions(utils.get_spill_partitions(engine))
+            if spill_groups:
+                for key, group in groups.items():
+                    for value in group:
+                        partitions.add(key, (key, value))
+                groups.clear()
+                tracker.release()
+    if partitions is None:
+        # the groups are handed off to the caller as a whole
+        tracker.release()
+        return groups.items()
+    return _group_partitions(
+        groups, tracker, partitions, accountant, group_factory, add)
+
+
+def _group_partitions(groups, tracker, partitions, accountant,
+                      group_factory, add):
+    try:
+        yield from groups.items()
+        tracker.release()
+        groups = {}
+        for partition in partitions:
+            tracker = accountant.track(groups)
+            for key, value in partition:
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = group = group_factory()
+                    tracker.add(group)
+                if add(group, value):
+                    tracker.add(value)
+            yield from groups.items()
+            tracker.release()
+            groups.clear()
+    finally:
+        tracker.release()
+
+
 def group_by_function(allow_aggregator_fallback):
     @specs.parameter('collection', yaqltypes.Iterable())
     @specs.parameter('key_selector', yaqltypes.Lambda())
     @specs.parameter('value_selector', yaqltypes.Lambda())
     @specs.parameter('aggregator', yaqltypes.Lambda())
     @specs.method
-    def group_by(engine, collection, key_selector, value_selector=None,
-                 aggregator=None):
+    def group_by(engine, context, collection, key_selector,
+                 value_selector=None, aggregator=None):
         """:yaql:groupBy
 
         Returns a collection grouped by keySelector with applied valueSelector
         as values. Returns a list of pairs where the first value is a result
         value of keySelector and the second is a list of values which have
-        common keySelector return value.
+        common keySelector return value. Groups are returned in the order of
+        the first occurrence of their keys unless the estimated size of the
+        groups exceeds yaql.spillThreshold. Then the elements are spilled to
+        yaql.spillPartitions partitions by hash of their keys and grouped one
+        partition at a time, and groups are returned partition by partition.
 
         :signature: collection.groupBy(keySelector, valueSelector => null,
                                        aggregator => null)
@@ -933,7 +1912,15 @@ def group_by_function(allow_aggregator_fallback):
             return element itself
         :argType valueSelector: lambda
         :arg aggregator: function to aggregate value within each group. null by
-            default, which means no function to be evaluated on groups
+            default, which means no function to be evaluated on groups.
+            Standard count(), len(), sum(), min(), max(), avg(), first(),
+            last() and distinct().count() of the group are computed
+            incrementally without keeping the group values. count, sum, min,
+            max, avg, first, last and distinctCount keywords can be used as
+            a shorthand for them, e.g. sum stands for $.sum() and
+            distinctCount for $.distinct().count(). Keywords are only
+            recognized while the corresponding standard function is in
+            effect, otherwise they are plain keyword values
         :argType aggregator: lambda
         :returnType: list
 
@@ -943,14 +1930,21 @@ def group_by_function(allow_aggregator_fallback):
             [[1, ["a", "c"]], [2, ["b", "d"]]]
             yaql> [["a", 1], ["b", 2], ["c", 1]].groupBy($[1], $[0], $.sum())
             [[1, "ac"], [2, "b"]]
+            yaql> [[1, 2], [1, 4], [2, 5]].groupBy($[0], $[1], avg)
+            [[1, 3.0], [2, 5.0]]
         """
-        groups = {}
+        accumulator_factory = get_group_accumulator_factory(
+            aggregator, engine, context)
+        if accumulator_factory is not None:
+            groups = _group(
+                engine, context, collection, key_selector, value_selector,
+                accumulator_factory, _add_to_accumulator, False)
+            return ((key, accumulator.result()) for key, accumulator in groups)
+
         new_aggregator = GroupAggregator(aggregator, allow_aggregator_fallback)
-        for t in collection:
-            value = t if value_selector is None else value_selector(t)
-            groups.setdefault(key_selector(t), []).append(value)
-            utils.limit_memory_usage(engine, (1, groups))
-        return select(groups.items(), new_aggregator)
+        groups = _group(engine, context, collection, key_selector,
+                        value_selector, list, _add_to_list, True)
+        return map(new_aggregator, groups)
 
     return group_by
 
@@ -1015,11 +2009,12 @@ def zip_longest(*collections, **kwargs):
 @specs.parameter('collection2', yaqltypes.Iterable())
 @specs.parameter('predicate', yaqltypes.Lambda())
 @specs.parameter('selector', yaqltypes.Lambda())
-def join(engine, collection1, collection2, predicate, selector):
+def join(engine, context, collection1, collection2, predicate, selector):
     """:yaql:join
 
     Returns list of selector applied to those combinations of collection1 and
-    collection2 elements, for which predicate is true.
+    collection2 elements, for which predicate is true. Predicates of
+    $1.x = $2.y form are evaluated with a hash join, as in joinOn.
 
     :signature: collection1.join(collection2, predicate, selector)
     :receiverArg collection1: input collection
@@ -1040,13 +2035,306 @@ def join(engine, collection1, collection2, predicate, selector):
         yaql> [1,2,3,4].join([2,5,6], $1 > $2, [$1, $2])
         [[3, 2], [4, 2]]
     """
-    collection2 = utils.memorize(collection2, engine)
+    key_selectors = _get_equi_join_key_selectors(predicate, engine, context)
+    if key_selectors is not None:
+        yield from _hash_join(
+            engine, context, collection1, collection2,
+            key_selectors[0], key_selectors[1], selector, False)
+        return
+    collection2 = utils.memorize(collection2, engine, context)
     for self_item in collection1:
         for other_item in collection2:
             if predicate(self_item, other_item):
                 yield selector(self_item, other_item)
 
 
+def _get_referenced_variables(expr):
+    if isinstance(expr, expressions.GetContextValue):
+        name = expr.path.value
+        return {'$1' if name == '$' else name}
+    elif isinstance(expr, (expressions.Constant,
+                           expressions.KeywordConstant)):
+        return set()
+    elif isinstance(expr, expressions.MappingRuleExpression):
+        args = (expr.source, expr.destination)
+    elif isinstance(expr, expressions.Function):
+        args = expr.args
+    else:
+        return None
+    result = set()
+    for arg in args:
+        names = _get_referenced_variables(arg)
+        if names is None:
+            return None
+        result.update(names)
+    return result
+
+
+def _get_equi_join_key_selectors(predicate, engine, context):
+    """Returns key selectors for $1.x = $2.y shaped join predicates.
+
+    Returns None if predicate is not an equality of expression of the first
+    argument only and expression of the second argument only, if the
+    equality operator is overridden or if the expressions are not pure, as
+    the nested loop join would evaluate them for every pair.
+    """
+    expr = getattr(predicate, '__unwrapped__', None)
+    if not isinstance(expr, expressions.BinaryOperator) or \
+            expr.name != '*equal':
+        return None
+    overloads = context.collect_functions('*equal')
+    if len(overloads) != 1 or len(overloads[0]) != 1 or next(
+            iter(overloads[0])).payload is not \
+            yaql.standard_library.common.eq:
+        return None
+    left, right = expr.args
+    left_names = _get_referenced_variables(left)
+    right_names = _get_referenced_variables(right)
+    if left_names is None or right_names is None:
+        return None
+    if right_names == {'$1'} and left_names == {'$2'}:
+        left, right = right, left
+    elif left_names != {'$1'} or right_names != {'$2'}:
+        return None
+    if not yaqltypes.is_pure_expression(left, context) or \
+            not yaqltypes.is_pure_expression(right, context):
+        return None
+
+    def make_key_selector(key_expr, name):
+        def key_selector(item):
+            new_context = context.create_child_context()
+            new_context[name] = item
+            return key_expr(utils.NO_VALUE, new_context, engine)
+        return key_selector
+
+    return make_key_selector(left, '$1'), make_key_selector(right, '$2')
+
+
+def _hash_join(engine, context, collection1, collection2,
+               key_selector1, key_selector2, selector, outer):
+    # collection2 is not touched when there is nothing to join it with
+    collection1 = iter(collection1)
+    for first in collection1:
+        break
+    else:
+        return
+    rows = []
+    index = {}
+    tracker = utils.get_memory_accountant(context, engine).track(rows)
+    try:
+        for item in collection2:
+            key = key_selector2(item)
+            rows.append((key, item))
+            tracker.add(item)
+            if index is not None:
+                try:
+                    index.setdefault(key, []).append(item)
+                except TypeError:
+                    # unhashable keys are compared one by one
+                    index = None
+        if not rows and not outer:
+            return
+
+        for self_item in itertools.chain((first,), collection1):
+            key = key_selector1(self_item)
+            matches = None
+            if index is not None:
+                try:
+                    matches = index.get(key, ())
+                except TypeError:
+                    pass
+            if matches is None:
+                matches = [t for k, t in rows if k == key]
+            if matches:
+                for other_item in matches:
+                    yield selector(self_item, other_item)
+            elif outer:
+                yield selector(self_item, None)
+    finally:
+        tracker.release()
+
+
+@specs.method
+@specs.parameter('collection1', yaqltypes.Iterable())
+@specs.parameter('collection2', yaqltypes.Iterable())
+@specs.parameter('key_selector1', yaqltypes.Lambda())
+@specs.parameter('key_selector2', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda())
+def join_on(engine, context, collection1, collection2,
+            key_selector1, key_selector2, selector):
+    """:yaql:joinOn
+
+    Returns list of selector applied to those combinations of collection1 and
+    collection2 elements, for which key of collection1 element is equal to the
+    key of collection2 element. Unlike join, keys of collection2 are indexed
+    in a hash table so that it does not compare every pair of elements.
+
+    :signature: collection1.joinOn(collection2, keySelector1, keySelector2,
+                                   selector)
+    :receiverArg collection1: input collection
+    :argType collection1: iterable
+    :arg collection2: other input collection
+    :argType collection2: iterable
+    :arg keySelector1: function to extract key from collection1 element
+    :argType keySelector1: lambda
+    :arg keySelector2: function to extract key from collection2 element
+    :argType keySelector2: lambda
+    :arg selector: function of two arguments to apply to every
+        (collection1, collection2) pair with equal keys
+    :argType selector: lambda
+    :returnType: iterable
+
+    .. code::
+
+        yaql> [[1, "a"], [2, "b"]].joinOn([[1, "c"], [1, "d"]], $[0], $[0],
+                                          [$1[1], $2[1]])
+        [["a", "c"], ["a", "d"]]
+    """
+    return _hash_join(engine, context, collection1, collection2,
+                      key_selector1, key_selector2, selector, False)
+
+
+@specs.method
+@specs.parameter('collection1', yaqltypes.Iterable())
+@specs.parameter('collection2', yaqltypes.Iterable())
+@specs.parameter('key_selector1', yaqltypes.Lambda())
+@specs.parameter('key_selector2', yaqltypes.Lambda())
+@specs.parameter('selector', yaqltypes.Lambda())
+def left_join_on(engine, context, collection1, collection2,
+                 key_selector1, key_selector2, selector):
+    """:yaql:leftJoinOn
+
+    Returns list of selector applied to those combinations of collection1 and
+    collection2 elements, for which key of collection1 element is equal to the
+    key of collection2 element. For collection1 elements that have no matching
+    collection2 element, selector is called with null as the second argument.
+
+    :signature: collection1.leftJoinOn(collection2, keySelector1,
+                                       keySelector2, selector)
+    :receiverArg collection1: input collection
+    :argType collection1: iterable
+    :arg collection2: other input collection
+    :argType collection2: iterable
+    :arg keySelector1: function to extract key from collection1 element
+    :argType keySelector1: lambda
+    :arg keySelector2: function to extract key from collection2 element
+    :argType keySelector2: lambda
+    :arg selector: function of two arguments to apply to every
+        (collection1, collection2) pair with equal keys and to
+        (collection1, null) pair if there is no such pair
+    :argType selector: lambda
+    :returnType: iterable
+
+    .. code::
+
+        yaql> [[1, "a"], [2, "b"]].leftJoinOn([[1, "c"]], $[0], $[0],
+                                              [$1[1], $2])
+        [["a", [1, "c"]], ["b", null]]
+    """
+    return _hash_join(engine, context, collection1, collection2,
+                      key_selector1, key_selector2, selector, True)
+
+
+class Index(utils.FrozenDict):
+    """Immutable hash index mapping keys to lists of collection values."""
+
+    def get(self, key, default=()):
+        return self._d.get(key, default)
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('key_selector', yaqltypes.Lambda())
+@specs.parameter('value_selector', yaqltypes.Lambda())
+def index_by(engine, context, collection, key_selector, value_selector=None):
+    """:yaql:indexBy
+
+    Returns hash index of the collection which maps keys returned by
+    keySelector to lists of values (elements or results of valueSelector
+    if specified) having that key. Values keep collection order. The index
+    is built in a single pass and can be bound to a variable and probed
+    many times with get and contains in constant time.
+
+    :signature: collection.indexBy(keySelector, valueSelector => null)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg keySelector: function of one argument returning key of an element
+    :argType keySelector: lambda
+    :arg valueSelector: function of one argument returning value to be
+        stored in the index. null by default, which means elements
+        themselves
+    :argType valueSelector: lambda
+    :returnType: index
+
+    .. code::
+
+        yaql> let(idx => [[1, a], [2, b], [1, c]].indexBy($[0], $[1]))
+        -> [$idx.get(1), $idx.get(3), $idx.contains(2)]
+        [["a", "c"], [], true]
+    """
+    groups = {}
+    tracker = utils.get_memory_accountant(context, engine).track(groups)
+    for t in collection:
+        key = key_selector(t)
+        value = t if value_selector is None else value_selector(t)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = []
+            tracker.add(group)
+        group.append(value)
+        tracker.add(value)
+    tracker.release()
+    return Index((key, tuple(group)) for key, group in groups.items())
+
+
+@specs.parameter('index', Index)
+@specs.name('get')
+@specs.method
+def index_get(index, key):
+    """:yaql:get
+
+    Returns list of values stored in the index for the key or empty list if
+    there are none.
+
+    :signature: index.get(key)
+    :receiverArg index: index built by indexBy
+    :argType index: index
+    :arg key: key to look up
+    :argType key: any
+    :returnType: list
+
+    .. code::
+
+        yaql> [1, 2, 3, 4].indexBy($ mod 2).get(1)
+        [1, 3]
+    """
+    return index.get(key)
+
+
+@specs.parameter('index', Index)
+@specs.parameter('key', nullable=True)
+@specs.name('contains')
+@specs.method
+def index_contains(index, key):
+    """:yaql:contains
+
+    Returns true if the index has values for the key, false otherwise.
+
+    :signature: index.contains(key)
+    :receiverArg index: index built by indexBy
+    :argType index: index
+    :arg key: key to look up
+    :argType key: any
+    :returnType: boolean
+
+    .. code::
+
+        yaql> [1, 2, 3, 4].indexBy($ mod 2).contains(2)
+        false
+    """
+    return key in index
+
+
 @specs.method
 @specs.parameter('value', nullable=True)
 @specs.parameter('times', int)
@@ -1392,10 +2680,24 @@ def split_at(collection, index, to_list):
     return [lst[:index], lst[index:]]
 
 
+def _is_concatenation(selector, context):
+    # true for $1 + $2 with the standard operator
+    expr = getattr(selector, '__unwrapped__', None)
+    if not isinstance(expr, expressions.BinaryOperator) or \
+            expr.name != '#operator_+':
+        return False
+    left, right = expr.args
+    return isinstance(left, expressions.GetContextValue) and \
+        left.path.value in ('$', '$1') and \
+        isinstance(right, expressions.GetContextValue) and \
+        right.path.value == '$2' and \
+        utils.is_standard_function(context, '#operator_+')
+
+
 @specs.method
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.parameter('selector', yaqltypes.Lambda())
-def aggregate(collection, selector, seed=utils.NO_VALUE):
+def aggregate(context, collection, selector, seed=utils.NO_VALUE):
     """:yaql:aggregate
 
     Applies selector of two arguments cumulatively: to the first two elements
@@ -1421,6 +2723,9 @@ def aggregate(collection, selector, seed=utils.NO_VALUE):
         yaql> [].aggregate($1 + $2, 1)
         1
     """
+    if _is_concatenation(selector, context):
+        return _reduce(SumAccumulator(_with_native_fast_path(
+            selector, _native_add, _NUMBER_KINDS)), collection, seed)
     if seed is utils.NO_VALUE:
         return functools.reduce(selector, collection)
     else:
@@ -1484,7 +2789,7 @@ def _merge_dicts(dict1, dict2, list_merge_func, item_merger, max_levels=0):
 @specs.parameter('item_merger', yaqltypes.Lambda())
 @specs.parameter('max_levels', int)
 @specs.inject('to_list', yaqltypes.Delegate('to_list', method=True))
-def merge_with(engine, to_list, d, another, list_merger=None,
+def merge_with(engine, context, to_list, d, another, list_merger=None,
                item_merger=None, max_levels=0):
     """:yaql:mergeWith
 
@@ -1527,7 +2832,7 @@ def merge_with(engine, to_list, d, another, list_merger=None,
     """
     if list_merger is None:
         list_merger = lambda lst1, lst2: to_list(  # noqa: E731
-            distinct(engine, lst1 + lst2))
+            distinct(engine, context, lst1 + lst2))
     if item_merger is None:
         item_merger = lambda x, y: y  # noqa: E731
     return _merge_dicts(d, another, list_merger, item_merger, max_levels)
@@ -1600,11 +2905,272 @@ def accumulate(collection, selector, seed=utils.NO_VALUE):
         yield total
 
 
+def _check_window_size(name, value):
+    if value < 1:
+        raise ValueError('{0} must be positive'.format(name))
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('size', int)
+@specs.parameter('step', int)
+def window(collection, size, step=1):
+    """:yaql:window
+
+    Returns sliding windows of size consecutive collection elements. Every
+    next window starts step elements after the previous one, so with step
+    equal to size windows do not overlap. Only complete windows are
+    returned.
+
+    :signature: collection.window(size, step => 1)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg size: number of elements in a window
+    :argType size: integer
+    :arg step: number of elements between starts of adjacent windows.
+        1 by default
+    :argType step: integer
+    :returnType: iterator
+
+    .. code::
+
+        yaql> [1, 2, 3, 4, 5].window(3)
+        [[1, 2, 3], [2, 3, 4], [3, 4, 5]]
+        yaql> [1, 2, 3, 4, 5].window(2, 2)
+        [[1, 2], [3, 4]]
+    """
+    _check_window_size('size', size)
+    _check_window_size('step', step)
+    buffer = collections.deque(maxlen=size)
+    for i, item in enumerate(collection, 1 - size):
+        buffer.append(item)
+        if i >= 0 and i % step == 0:
+            yield tuple(buffer)
+
+
+def _rolling_reduce(collection, size, func):
+    # Two stacks sliding window aggregation: aggregates of the older part
+    # of the window are computed once when it is moved to the front stack,
+    # so every element takes part in a constant number of func calls on
+    # average and no inverse operation is required.
+    front = []
+    back = []
+    back_value = utils.NO_VALUE
+    for item in collection:
+        back.append(item)
+        back_value = item if back_value is utils.NO_VALUE \
+            else func(back_value, item)
+        if len(front) + len(back) > size:
+            if not front:
+                value = utils.NO_VALUE
+                for t in reversed(back):
+                    value = t if value is utils.NO_VALUE else func(t, value)
+                    front.append(value)
+                back = []
+                back_value = utils.NO_VALUE
+            front.pop()
+        if len(front) + len(back) == size:
+            if not front:
+                yield back_value
+            elif not back:
+                yield front[-1]
+            else:
+                yield func(front[-1], back_value)
+
+
+def _rolling_extremum(collection, size, is_better):
+    # monotonic queue of (index, value) pairs where no value is better
+    # than the values preceding it
+    queue = collections.deque()
+    for i, item in enumerate(collection):
+        while queue and not is_better(queue[-1][1], item):
+            queue.pop()
+        queue.append((i, item))
+        if queue[0][0] <= i - size:
+            queue.popleft()
+        if i >= size - 1:
+            yield queue[0][1]
+
+
+def _get_greater_function(operator, context):
+    if utils.is_standard_function(context, '#operator_>'):
+        return _with_native_fast_path(
+            operator, lambda a, b: a > b, _ORDERED_KINDS)
+    return operator
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('size', int)
+@specs.inject('operator', yaqltypes.Delegate('#operator_+'))
+def rolling_sum(context, operator, collection, size):
+    """:yaql:rollingSum
+
+    Returns sums of every size consecutive collection elements. Each
+    element is summed up a constant number of times on average regardless
+    of the window size.
+
+    :signature: collection.rollingSum(size)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg size: number of elements in a window
+    :argType size: integer
+    :returnType: iterator
+
+    .. code::
+
+        yaql> [1, 2, 3, 4, 5].rollingSum(3)
+        [6, 9, 12]
+    """
+    _check_window_size('size', size)
+    return _rolling_reduce(
+        collection, size, _get_sum_function(operator, context))
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('size', int)
+@specs.inject('operator', yaqltypes.Delegate('#operator_+'))
+def rolling_avg(context, operator, collection, size):
+    """:yaql:rollingAvg
+
+    Returns moving averages of every size consecutive collection elements.
+
+    :signature: collection.rollingAvg(size)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg size: number of elements in a window
+    :argType size: integer
+    :returnType: iterator
+
+    .. code::
+
+        yaql> [1, 2, 3, 4, 6].rollingAvg(2)
+        [1.5, 2.5, 3.5, 5.0]
+    """
+    _check_window_size('size', size)
+    return (t / size for t in _rolling_reduce(
+        collection, size, _get_sum_function(operator, context)))
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('size', int)
+@specs.inject('operator', yaqltypes.Delegate('#operator_>'))
+def rolling_max(context, operator, collection, size):
+    """:yaql:rollingMax
+
+    Returns max values of every size consecutive collection elements.
+
+    :signature: collection.rollingMax(size)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg size: number of elements in a window
+    :argType size: integer
+    :returnType: iterator
+
+    .. code::
+
+        yaql> [1, 3, 2, 5, 4].rollingMax(2)
+        [3, 3, 5, 5]
+    """
+    _check_window_size('size', size)
+    return _rolling_extremum(
+        collection, size, _get_greater_function(operator, context))
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('size', int)
+@specs.inject('operator', yaqltypes.Delegate('#operator_>'))
+def rolling_min(context, operator, collection, size):
+    """:yaql:rollingMin
+
+    Returns min values of every size consecutive collection elements.
+
+    :signature: collection.rollingMin(size)
+    :receiverArg collection: input collection
+    :argType collection: iterable
+    :arg size: number of elements in a window
+    :argType size: integer
+    :returnType: iterator
+
+    .. code::
+
+        yaql> [1, 3, 2, 5, 4].rollingMin(2)
+        [1, 2, 2, 4]
+    """
+    _check_window_size('size', size)
+    greater = _get_greater_function(operator, context)
+    return _rolling_extremum(collection, size, lambda a, b: greater(b, a))
+
+
+@specs.method
+@specs.parameter('collection', yaqltypes.Iterable())
+@specs.parameter('key', yaqltypes.Lambda())
+@specs.parameter('duration', datetime.timedelta)
+@specs.parameter('step', datetime.timedelta, nullable=True)
+def time_window(collection, key, duration, step=None):
+    """:yaql:timeWindow
+
+    Returns windows of collection elements whose keys fall into the same
+    time interval. Intervals are duration long, the first one starts at the
+    key of the first element and every next one starts step later. By
+    default step is equal to duration, so windows do not overlap. Empty
+    windows are skipped. Collection must be ordered by key.
+
+    :signature: collection.timeWindow(key, duration, step => null)
+    :receiverArg collection: collection ordered by key
+    :argType collection: iterable
+    :arg key: function of one argument returning datetime key of an element
+    :argType key: lambda
+    :arg duration: length of an interval
+    :argType duration: timespan
+    :arg step: time between starts of adjacent intervals. null by default
+    :argType step: timespan
+    :returnType: iterator
+
+    .. code::
+
+        yaql> range(5).select([datetime(2020, 1, 1, 0, $ * 2), $])
+        .timeWindow($[0], timespan(minutes => 5)).select($.select($[1]))
+        [[0, 1, 2], [3, 4]]
+    """
+    if step is None:
+        step = duration
+    if duration <= datetime.timedelta(0) or step <= datetime.timedelta(0):
+        raise ValueError('duration and step must be positive')
+    buffer = collections.deque()
+    start = previous_key = None
+    for item in collection:
+        item_key = key(item)
+        if start is None:
+            start = item_key
+        elif item_key < previous_key:
+            raise ValueError('collection must be ordered by key')
+        previous_key = item_key
+        while item_key >= start + duration:
+            if buffer:
+                yield tuple(t for _, t in buffer)
+                start += step
+                while buffer and buffer[0][0] < start:
+                    buffer.popleft()
+            if not buffer and item_key >= start + duration:
+                # skip intervals without elements
+                start += ((item_key - start - duration) // step + 1) * step
+        buffer.append((item_key, item))
+    while buffer:
+        yield tuple(t for _, t in buffer)
+        start += step
+        while buffer and buffer[0][0] < start:
+            buffer.popleft()
+
+
 @specs.parameter('predicate', yaqltypes.Lambda())
-@specs.parameter('producer', yaqltypes.Lambda())
+@specs.parameter('producer', yaqltypes.Lambda(memoize=True))
 @specs.parameter('selector', yaqltypes.Lambda())
 @specs.parameter('decycle', bool)
-def generate(engine, initial, predicate, producer, selector=None,
+def generate(engine, context, initial, predicate, producer, selector=None,
              decycle=False):
     """:yaql:generate
 
@@ -1637,26 +3203,35 @@ def generate(engine, initial, predicate, producer, selector=None,
         yaql> generate(1, $ < 10, $ + 2, $ * 1000)
         [1000, 3000, 5000, 7000, 9000]
     """
-    past_items = None if not decycle else set()
-    while predicate(initial):
-        if past_items is not None:
-            if initial in past_items:
-                break
-            past_items.add(initial)
-            utils.limit_memory_usage(engine, (1, past_items))
-        if selector is None:
-            yield initial
-        else:
-            yield selector(initial)
-        initial = producer(initial)
+    if not decycle:
+        past_items = tracker = None
+    else:
+        past_items = set()
+        tracker = utils.get_memory_accountant(context, engine).track(
+            past_items)
+    try:
+        while predicate(initial):
+            if past_items is not None:
+                if initial in past_items:
+                    break
+                past_items.add(initial)
+                tracker.add(initial)
+            if selector is None:
+                yield initial
+            else:
+                yield selector(initial)
+            initial = producer(initial)
+    finally:
+        if tracker is not None:
+            tracker.release()
 
 
-@specs.parameter('producer', yaqltypes.Lambda())
+@specs.parameter('producer', yaqltypes.Lambda(memoize=True))
 @specs.parameter('selector', yaqltypes.Lambda())
 @specs.parameter('decycle', bool)
 @specs.parameter('depth_first', bool)
-def generate_many(engine, initial, producer, selector=None, decycle=False,
-                  depth_first=False):
+def generate_many(engine, context, initial, producer, selector=None,
+                  decycle=False, depth_first=False):
     """:yaql:generateMany
 
     Returns iterator to values beginning from initial queue of values with
@@ -1687,34 +3262,42 @@ def generate_many(engine, initial, producer, selector=None, decycle=False,
                                  }.get($, []))
         ["1", "2", "3", "4", "5"]
     """
+    accountant = utils.get_memory_accountant(context, engine)
     past_items = None if not decycle else set()
+    past_items_tracker = None if not decycle else accountant.track(past_items)
     queue = utils.QueueType([initial])
-    while queue:
-        item = queue.popleft()
-        if past_items is not None:
-            if item in past_items:
-                continue
+    queue_tracker = accountant.track(queue)
+    queue_tracker.add(initial)
+    try:
+        while queue:
+            item = queue.popleft()
+            queue_tracker.remove()
+            if past_items is not None:
+                if item in past_items:
+                    continue
+                else:
+                    past_items.add(item)
+                    past_items_tracker.add(item)
+            if selector is None:
+                yield item
             else:
-                past_items.add(item)
-                utils.limit_memory_usage(engine, (1, past_items))
-        if selector is None:
-            yield item
-        else:
-            yield selector(item)
-        produced = producer(item)
-        if depth_first:
+                yield selector(item)
             len_before = len(queue)
-            queue.extend(produced)
-            queue.rotate(len(queue) - len_before)
-        else:
-            queue.extend(produced)
-        utils.limit_memory_usage(engine, (1, queue))
+            queue.extend(producer(item))
+            for i in range(len_before, len(queue)):
+                queue_tracker.add(queue[i])
+            if depth_first:
+                queue.rotate(len(queue) - len_before)
+    finally:
+        queue_tracker.release()
+        if past_items_tracker is not None:
+            past_items_tracker.release()
 
 
 @specs.method
 @specs.parameter('collection', yaqltypes.Iterable())
 @specs.parameter('default', yaqltypes.Iterable())
-def default_if_empty(engine, collection, default):
+def default_if_empty(engine, context, collection, default):
     """:yaql:defaultIfEmpty
 
     Returns default value if collection is empty.
@@ -1733,7 +3316,7 @@ def default_if_empty(engine, collection, default):
     """
     if isinstance(collection, (utils.SequenceType, utils.SetType)):
         return default if len(collection) == 0 else collection
-    collection = memorize(collection, engine)
+    collection = memorize(collection, engine, context)
     it = iter(collection)
     try:
         next(it)
@@ -1745,11 +3328,19 @@ def default_if_empty(engine, collection, default):
 def register(context, allow_group_by_agg_fallback=True):
     context.register_function(where)
     context.register_function(where, name='filter')
+    context.register_function(where_columnar)
+    context.register_function(where_columnar, name='filter')
     context.register_function(select)
     context.register_function(select, name='map')
+    context.register_function(select_columnar)
+    context.register_function(select_columnar, name='map')
+    context.register_function(parallel_where)
+    context.register_function(parallel_select)
     context.register_function(collection_attribution)
     context.register_function(limit)
     context.register_function(limit, name='take')
+    context.register_function(limit_ordered)
+    context.register_function(limit_ordered, name='take')
     context.register_function(skip)
     context.register_function(append)
     context.register_function(distinct)
@@ -1759,11 +3350,17 @@ def register(context, allow_group_by_agg_fallback=True):
     context.register_function(concat)
     context.register_function(count_)
     context.register_function(count)
+    context.register_function(count_columnar)
     context.register_function(memorize)
     context.register_function(sum_)
+    context.register_function(sum_columnar)
     context.register_function(min_)
+    context.register_function(min_columnar)
     context.register_function(max_)
+    context.register_function(max_columnar)
+    context.register_function(avg)
     context.register_function(first)
+    context.register_function(first_ordered)
     context.register_function(single)
     context.register_function(last)
     context.register_function(select_many)
@@ -1775,6 +3372,12 @@ def register(context, allow_group_by_agg_fallback=True):
     context.register_function(then_by_descending)
     context.register_function(group_by_function(allow_group_by_agg_fallback))
     context.register_function(join)
+    context.register_function(join_on)
+    context.register_function(left_join_on)
+    context.register_function(index_by)
+    context.register_function(index_by, name='lookup')
+    context.register_function(index_get)
+    context.register_function(index_contains)
     context.register_function(zip_)
     context.register_function(zip_longest)
     context.register_function(repeat)
@@ -1792,6 +3395,12 @@ def register(context, allow_group_by_agg_fallback=True):
     context.register_function(aggregate)
     context.register_function(aggregate, name='reduce')
     context.register_function(accumulate)
+    context.register_function(window)
+    context.register_function(rolling_sum)
+    context.register_function(rolling_avg)
+    context.register_function(rolling_max)
+    context.register_function(rolling_min)
+    context.register_function(time_window)
     context.register_function(reverse)
     context.register_function(merge_with)
     context.register_function(is_iterable)
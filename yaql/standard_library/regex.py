@@ -15,7 +15,9 @@
 The module contains functions for regular expressions.
 """
 
+import collections
 import re
+import threading
 
 from yaql.language import specs
 from yaql.language import yaqltypes
@@ -23,6 +25,119 @@ from yaql.language import yaqltypes
 REGEX_TYPE = type(re.compile('.'))
 
 
+class PatternCache:
+    """Bounded cache of compiled regular expressions.
+
+    Patterns that are not constant in the expression are compiled through
+    this cache shared by all evaluations. Unlike the internal cache of the
+    re module it can be sized for large rule sets and evicts only the least
+    recently used patterns. Constant patterns are compiled once per parsed
+    expression instead (see expressions.ConstantRegexExpression).
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._patterns = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, pattern, flags=0):
+        return self.get((pattern, flags), re.compile, pattern, flags)
+
+    def get(self, key, factory, *args):
+        """Returns cached result of factory(*args) for the key.
+
+        Lets other functions keep objects compiled from several patterns
+        (see compile_literals() and match_any()) in the same cache.
+        """
+        with self._lock:
+            if key in self._patterns:
+                self.hits += 1
+                self._patterns.move_to_end(key)
+                return self._patterns[key]
+            self.misses += 1
+        result = factory(*args)
+        with self._lock:
+            self._patterns[key] = result
+            while len(self._patterns) > self.max_size:
+                self._patterns.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self.hits = self.misses = 0
+
+    def report(self):
+        return {
+            'size': len(self._patterns),
+            'maxSize': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+pattern_cache = PatternCache()
+
+
+def _trie_pattern(node):
+    alternatives = []
+    for char, child in node.items():
+        if not char:
+            continue
+        chars = [char]
+        # chains of nodes with a single child become plain literals
+        while len(child) == 1 and '' not in child:
+            char, child = next(iter(child.items()))
+            chars.append(char)
+        alternatives.append(re.escape(''.join(chars)) + _trie_pattern(child))
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and '' not in node:
+        return alternatives[0]
+    pattern = '(?:{})'.format('|'.join(alternatives))
+    return pattern + '?' if '' in node else pattern
+
+
+def _compile_literals(strings, reverse):
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in reversed(string) if reverse else string:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    try:
+        return re.compile(_trie_pattern(trie))
+    except (RecursionError, re.error, OverflowError):
+        return None
+
+
+def compile_literals(strings, reverse=False):
+    """Returns regex matching any of the literal strings.
+
+    The strings are arranged into a trie, so the regex checks a single
+    alternative per character no matter how many strings there are. With
+    reverse the regex matches the reversed strings, which is used to test
+    suffixes. Returns None if the regex cannot be compiled (e.g. the trie
+    is too deep) and the strings have to be checked one by one.
+    """
+    strings = tuple(strings)
+    return pattern_cache.get(
+        ('#literals', strings, reverse), _compile_literals, strings, reverse)
+
+
+def _get_flags(ignore_case, multi_line, dot_all):
+    flags = re.UNICODE
+    if ignore_case:
+        flags |= re.IGNORECASE
+    if multi_line:
+        flags |= re.MULTILINE
+    if dot_all:
+        flags |= re.DOTALL
+    return flags
+
+
 @specs.parameter('pattern', yaqltypes.String())
 def regex(pattern, ignore_case=False, multi_line=False, dot_all=False):
     """:yaql:regex
@@ -57,14 +172,8 @@ def regex(pattern, ignore_case=False, multi_line=False, dot_all=False):
         yaql> regex("A.c", ignoreCase => true).matches("abc")
         true
     """
-    flags = re.UNICODE
-    if ignore_case:
-        flags |= re.IGNORECASE
-    if multi_line:
-        flags |= re.MULTILINE
-    if dot_all:
-        flags |= re.DOTALL
-    return re.compile(pattern, flags)
+    return pattern_cache.compile(
+        pattern, _get_flags(ignore_case, multi_line, dot_all))
 
 
 @specs.parameter('regexp', REGEX_TYPE)
@@ -110,7 +219,7 @@ def matches_(string, regexp):
         yaql> "abc".matches("a.c")
         true
     """
-    return re.search(regexp, string) is not None
+    return pattern_cache.compile(regexp).search(string) is not None
 
 
 @specs.parameter('regexp', REGEX_TYPE)
@@ -156,7 +265,7 @@ def matches_operator_string(string, pattern):
         yaql> "abc" =~ "a.c"
         true
     """
-    return re.search(pattern, string) is not None
+    return pattern_cache.compile(pattern).search(string) is not None
 
 
 @specs.parameter('regexp', REGEX_TYPE)
@@ -206,7 +315,68 @@ def not_matches_operator_string(string, pattern):
         yaql> "abc" !~ regex("a.c")
         false
     """
-    return re.search(pattern, string) is None
+    return pattern_cache.compile(pattern).search(string) is None
+
+
+# patterns referring to groups by number or name cannot be joined together
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def _compile_any(patterns, flags):
+    regexps = [pattern_cache.compile(pattern, flags) for pattern in patterns]
+    if not regexps:
+        return lambda string: False
+    if not any(_GROUP_REFERENCE.search(pattern) for pattern in patterns):
+        try:
+            search = re.compile('|'.join(
+                '(?:{})'.format(pattern) for pattern in patterns),
+                flags).search
+            return lambda string: search(string) is not None
+        except re.error:
+            # e.g. the same group name in two patterns or inline flags
+            pass
+    return lambda string: any(
+        regexp.search(string) is not None for regexp in regexps)
+
+
+@specs.parameter('string', yaqltypes.String())
+@specs.parameter('patterns', yaqltypes.Sequence())
+@specs.method
+def match_any(string, patterns, ignore_case=False, multi_line=False,
+              dot_all=False):
+    """:yaql:matchAny
+
+    Returns true if string matches any of the regex patterns, false
+    otherwise. Patterns are joined into a single regex compiled once for
+    the list, so the string is scanned once rather than once per pattern.
+
+    :signature: string.matchAny(patterns, ignoreCase => false,
+        multiLine => false, dotAll => false)
+    :receiverArg string: string to find match in
+    :argType string: string
+    :arg patterns: regex patterns
+    :argType patterns: list of strings
+    :arg ignoreCase: true makes performing case-insensitive matching.
+    :argType ignoreCase: boolean
+    :arg multiLine: true makes character '^' and '$' to match at the
+        beginning and at the end of each line.
+    :argType multiLine: boolean
+    :arg dotAll: true makes the '.' special character to match any character
+        (including a newline).
+    :argType dotAll: boolean
+    :returnType: boolean
+
+    .. code::
+
+        yaql> "abc".matchAny(["x+", "a.c"])
+        true
+        yaql> "ABC".matchAny(["x+", "a.c"])
+        false
+    """
+    flags = _get_flags(ignore_case, multi_line, dot_all)
+    patterns = tuple(patterns)
+    return pattern_cache.get(
+        ('#any', patterns, flags), _compile_any, patterns, flags)(string)
 
 
 def _publish_match(context, match):
@@ -578,6 +748,7 @@ def register(context):
     context.register_function(matches_operator_regex)
     context.register_function(not_matches_operator_string)
     context.register_function(not_matches_operator_regex)
+    context.register_function(match_any)
     context.register_function(search)
     context.register_function(search_all)
     context.register_function(split)
@@ -20,6 +20,12 @@ import string as string_module
 from yaql.language import specs
 from yaql.language import utils
 from yaql.language import yaqltypes
+from yaql.standard_library import regex as regex_module
+
+
+# number of replacement keys or prefixes starting from which they are
+# matched with a single regex instead of one by one
+_MIN_LITERALS = 8
 
 
 @specs.parameter('left', yaqltypes.String())
@@ -526,13 +532,98 @@ def replace(string, old, new, count=-1):
     return string.replace(old, new, count)
 
 
+def _is_prefix_of(left, right):
+    # true if a proper suffix of left is a prefix of right
+    index = left.find(right[0], 1)
+    while index >= 0:
+        if right.startswith(left[index:]):
+            return True
+        index = left.find(right[0], index + 1)
+    return False
+
+
+def _overlap(left, right):
+    return (left in right or right in left or
+            _is_prefix_of(left, right) or _is_prefix_of(right, left))
+
+
+def _compile_replacements(pairs):
+    """Returns function doing all the replacements in a single pass.
+
+    The single pass gives the same result as the sequential replacements
+    only if no key overlaps another one and no replacement value can form
+    a key that comes after it, in which case None is returned.
+    """
+    keys = [old for old, _ in pairs]
+    if not all(keys) or len(set(keys)) < len(keys):
+        return None
+    for i, (old, new) in enumerate(pairs):
+        for key in keys[i + 1:]:
+            if _overlap(old, key):
+                return None
+            if new:
+                if _overlap(new, key):
+                    return None
+            elif len(key) > 1:
+                # removed key joins the text around it
+                return None
+    regexp = regex_module.compile_literals(keys)
+    if regexp is None:
+        return None
+    mapping = dict(pairs)
+
+    def replace_all(string, count):
+        if count < 0:
+            return regexp.sub(lambda match: mapping[match.group()], string)
+        counters = dict.fromkeys(mapping, count)
+
+        def replace_first(match):
+            old = match.group()
+            if counters[old]:
+                counters[old] -= 1
+                return mapping[old]
+            return old
+        return regexp.sub(replace_first, string)
+    return replace_all
+
+
+class _Replacements(utils.FrozenDict):
+    """Dictionary of replacements with their string pairs prepared."""
+
+    def __init__(self, replacements):
+        super().__init__(replacements)
+        self.pairs = tuple((str_(key), str_(value))
+                           for key, value in replacements.items())
+        self.replacer = None
+        if len(self.pairs) >= _MIN_LITERALS:
+            self.replacer = _compile_replacements(self.pairs)
+
+
+@specs.parameter('replacements', utils.MappingType)
+@specs.name('#replacements')
+def build_replacements(replacements):
+    """:yaql:replacements
+
+    Returns dictionary of replacements for replace() with their keys and
+    values converted to strings and compiled into a single pass replacer in
+    advance. This function is system and is used for constant dictionary
+    literals passed to replace().
+
+    :signature: replacements(replacements)
+    :arg replacements: dict of replacements in format {old => new ...}
+    :argType replacements: mapping
+    :returnType: mapping
+    """
+    return _Replacements(replacements)
+
+
 @specs.parameter('string', yaqltypes.String())
 @specs.parameter('replacements', utils.MappingType)
 @specs.parameter('count', int)
 @specs.inject('str_func', yaqltypes.Delegate('str'))
 @specs.method
 @specs.name('replace')
-def replace_with_dict(string, str_func, replacements, count=-1):
+def replace_with_dict(context, string, str_func, replacements, count=-1):
     """:yaql:replace
 
     Returns a string with all occurrences of replacements' keys replaced
@@ -559,8 +650,23 @@ def replace_with_dict(string, str_func, replacements, count=-1):
         yaql> "abc ab abc".replace({ab => yy, abc => xx}, 1)
         "yyc ab xx"
     """
-    for key, value in replacements.items():
-        string = string.replace(str_func(key), str_func(value), count)
+    if isinstance(replacements, _Replacements):
+        pairs = replacements.pairs
+        if replacements.replacer is not None:
+            return replacements.replacer(string, count)
+    elif len(replacements) >= _MIN_LITERALS and utils.is_standard_function(
+            context, 'str'):
+        pairs = tuple((str_(key), str_(value))
+                      for key, value in replacements.items())
+        replacer = regex_module.pattern_cache.get(
+            ('#replace', pairs), _compile_replacements, pairs)
+        if replacer is not None:
+            return replacer(string, count)
+    else:
+        pairs = [(str_func(key), str_func(value))
+                 for key, value in replacements.items()]
+    for old, new in pairs:
+        string = string.replace(old, new, count)
     return string
 
 
@@ -946,6 +1052,10 @@ def starts_with(string, *prefixes):
         yaql> "abcd".startsWith("yy", "xx", "zz")
         false
     """
+    if len(prefixes) >= _MIN_LITERALS:
+        regexp = regex_module.compile_literals(prefixes)
+        if regexp is not None:
+            return regexp.match(string) is not None
     return string.startswith(prefixes)
 
 
@@ -971,6 +1081,11 @@ def ends_with(string, *suffixes):
         yaql> "abcd".endsWith("yy", "xx", "zz")
         false
     """
+    if len(suffixes) >= _MIN_LITERALS:
+        regexp = regex_module.compile_literals(
+            suffixes, reverse=True)
+        if regexp is not None:
+            return regexp.match(string[::-1]) is not None
     return string.endswith(suffixes)
 
 
@@ -1013,6 +1128,7 @@ def register(context):
     context.register_function(trim_right)
     context.register_function(replace)
     context.register_function(replace_with_dict)
+    context.register_function(build_replacements)
     context.register_function(is_empty)
     context.register_function(string_by_int)
     context.register_function(int_by_string)
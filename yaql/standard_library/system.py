@@ -231,7 +231,7 @@ def send_context(left, right):
 @specs.method
 @specs.parameter('condition', yaqltypes.Lambda())
 @specs.parameter('message', yaqltypes.String())
-def assert__(engine, obj, condition, message='Assertion failed'):
+def assert__(engine, context, obj, condition, message='Assertion failed'):
     """:yaql:assert
 
     Evaluates condition against object. If it evaluates to true returns the
@@ -257,7 +257,7 @@ def assert__(engine, obj, condition, message='Assertion failed'):
         Execution exception: Failed assertion
     """
     if utils.is_iterator(obj):
-        obj = utils.memorize(obj, engine)
+        obj = utils.memorize(obj, engine, context)
     if not condition(obj):
         raise AssertionError(message)
     return obj
@@ -41,12 +41,25 @@ Any mentioned operation on yaqlized objects can be disabled with additional
 parameters for yaqlization. Also it is possible to specify whitelist/blacklist
 of methods/attributes/keys that are exposed to the yaql.
 
+Methods of yaqlized objects that wait for I/O can be called concurrently
+from select(). With
+
+.. code-block:: python
+
+    yaqlization.yaqlize(Node, max_concurrent_calls=8)
+
+``$.nodes.select($.fetch_status())`` evaluates the selector for up to 8
+nodes at a time in a pool of threads. The results keep the order of nodes.
+Other items of the collection are evaluated one by one as usual.
+
 This module provides implemented operators on Yaqlized objects.
 """
 
 
+import collections
 import re
 
+from yaql.language import asynchronous
 from yaql.language import expressions
 from yaql.language import runner
 from yaql.language import specs
@@ -208,6 +221,58 @@ def indexation(obj, key):
     return res
 
 
+def get_max_concurrent_calls(obj):
+    settings = yaqlization.get_yaqlization_settings(obj)
+    if settings is None or not settings['yaqlizeMethods']:
+        return None
+    return settings.get('maxConcurrentCalls')
+
+
+def map_concurrently(func, collection):
+    """Maps the collection calling func on its items in pools of threads.
+
+    The selector is evaluated in a pool of threads only for items that are
+    yaqlized objects with max_concurrent_calls set, at most that many at a
+    time. Other items are evaluated in the calling thread once the results
+    of the preceding items are returned. When nothing was yaqlized with
+    max_concurrent_calls, this is map().
+    """
+    if not yaqlization.has_concurrent_calls():
+        return map(func, collection)
+    return _map_concurrently(func, collection)
+
+
+def _map_concurrently(func, collection):
+    pools = {}
+    pending = collections.deque()
+    try:
+        for item in collection:
+            # no new calls are started after a failure
+            if any(future.done() and future.exception() is not None
+                   for future in pending):
+                break
+            max_workers = get_max_concurrent_calls(item)
+            if not max_workers or max_workers < 2:
+                while pending:
+                    yield pending.popleft().result()
+                yield func(item)
+                continue
+            pool = pools.get(max_workers)
+            if pool is None:
+                pool = asynchronous.ThreadPool(max_workers)
+                pools[max_workers] = pool
+            pending.append(pool.submit(func, item))
+            while len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # calls in flight are waited for so that none of them outlives
+        # the select
+        for pool in pools.values():
+            pool.close(wait=True)
+
+
 def register(context):
     context = context.create_child_context()
     context.register_function(op_dot)
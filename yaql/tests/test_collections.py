@@ -13,6 +13,8 @@
 #    under the License.
 
 from yaql.language import exceptions
+from yaql.language import expressions
+from yaql.language import utils
 import yaql.tests
 
 
@@ -218,6 +220,39 @@ class TestCollections(yaql.tests.TestCase):
         self.assertTrue(self.eval('{[1, 2] => [3, 4]}.containsValue([3, 4])'))
         self.assertTrue(self.eval('set([1, 2], 5).contains([1, 2])'))
 
+    def test_constant_membership_target(self):
+        data = ['a', 'b', 2, True, 1, None, 3.5, [1]]
+        self.assertEqual(
+            4, self.eval('$.where($ in [a, 2, null, 3.5]).len()', data=data))
+        self.assertEqual(
+            2, self.eval('$.where([a, 2].contains($)).len()', data=data))
+        self.assertEqual(
+            3, self.eval('$.where([b, 1.0].contains($)).len()', data=data))
+        expr = self.engine('$ in [a, 2]')
+        target = expr.expression.args[1]
+        self.assertIsInstance(target, expressions.ConstantListExpression)
+        self.assertIsInstance(
+            self.engine('[a, 2].contains($)').expression.args[0],
+            expressions.ConstantListExpression)
+        self.assertNotIsInstance(
+            self.engine('$ in [a, $]').expression.args[1],
+            expressions.ConstantListExpression)
+        # the list is built once and tested for membership with a set
+        value = target(utils.NO_VALUE, self.context, self.engine)
+        self.assertIsInstance(value, utils.HashedTuple)
+        self.assertIs(value, target(utils.NO_VALUE, self.context, self.engine))
+
+        values = utils.HashedTuple(['a', [1], 2])
+        self.assertIsNone(values._set)
+        self.assertIn([1], values)
+        values = utils.HashedTuple(['a', 2])
+        self.assertIn(2.0, values)
+        self.assertNotIn([2], values)
+
+        context = self.context.create_child_context()
+        context.register_function(lambda *args: args + (9,), name='#list')
+        self.assertTrue(self.eval('9 in [1, 2]', context=context))
+
     def test_list_addition(self):
         self.assertEqual(
             [1, 2, 3, 4],
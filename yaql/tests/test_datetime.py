@@ -15,9 +15,11 @@
 import datetime
 import time
 
+from dateutil import parser
 from dateutil import tz
 from testtools import matchers
 
+from yaql.standard_library import date_time
 import yaql.tests
 
 DT = datetime.datetime
@@ -65,6 +67,41 @@ class TestDatetime(yaql.tests.TestCase):
                       '"%A, %d. %B %Y %I:%M%p")')
         )
 
+    def test_build_datetime_fast_paths(self):
+        for string in ['2008-09-03', '2008-09-03 20:56', '2008-09-03T20:56Z',
+                       '2008-09-03T20:56:35.45+0300', '2008-09-03T20:56-05',
+                       '2008-09-03T20:56:35-00:00', '2008-09-03T20:56+00:00']:
+            self.assertIsNotNone(date_time._parse_iso_datetime(string))
+            expected = parser.parse(string)
+            expected = expected.replace(
+                tzinfo=expected.tzinfo or tz.tzutc())
+            result = self.eval('datetime($)', data=string)
+            self.assertEqual(expected, result)
+            self.assertEqual(repr(expected.tzinfo), repr(result.tzinfo))
+        self.assertRaises(ValueError, self.eval, 'datetime("2008-02-30")')
+
+        for string, format_ in [
+                ('03.09.2008 20:56:35', '%d.%m.%Y %H:%M:%S'),
+                ('2008-9-3T20:56:35.45Z', '%Y-%m-%dT%H:%M:%S.%f%z'),
+                ('2008-09-03  20:56 -0530', '%Y-%m-%d %H:%M %z'),
+                ('2008-09-03 20:56+01:02:03', '%Y-%m-%d %H:%M%z'),
+                ('100% 8', '100%% %m')]:
+            expected = DT.strptime(string, format_)
+            result = self.eval('datetime($[0], $[1])',
+                               data=[string, format_])
+            self.assertEqual(expected.replace(
+                tzinfo=expected.tzinfo or tz.tzutc()), result)
+        self.assertIsNone(date_time._compile_format('%d %b %Y'))
+        self.assertRaises(
+            ValueError, self.eval, 'datetime("03.09.2008x", "%d.%m.%Y")')
+
+        engine = self.engine.copy({'yaql.datetimeCache': True})
+        self.assertIs(
+            engine('datetime("2008-09-03T20:56")').evaluate(
+                context=self.context),
+            engine('datetime("2008-09-03T20:56")').evaluate(
+                context=self.context))
+
     def test_datetime_fields(self):
         dt = DT(2006, 11, 21, 16, 30, tzinfo=tz.tzutc())
         self.assertEqual(2006, self.eval('$.year', dt))
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import asyncio
 import io
 import sys
 
@@ -303,3 +304,47 @@ class TestEngine(tests.TestCase):
         data = {'a': [1]}
         expr = engine('$.a[0]')
         self.assertEqual(1, expr.evaluate(context=self.context, data=data))
+
+    def test_evaluate_async(self):
+        active = []
+        max_active = [0]
+
+        async def fetch(key):
+            active.append(key)
+            max_active[0] = max(max_active[0], len(active))
+            await asyncio.sleep(0.05)
+            active.remove(key)
+            return key * 2
+
+        context = self.context.create_child_context()
+        context.register_function(fetch)
+
+        def evaluate(expr, data=None):
+            return asyncio.run(self.engine(expr).evaluate_async(
+                data=data, context=context))
+
+        self.assertEqual([2, 4, 6], evaluate('[fetch(1), fetch(2), fetch(3)]'))
+        self.assertEqual(3, max_active[0])
+
+        max_active[0] = 0
+        self.assertEqual(
+            {'a': 2, 'b': 4}, evaluate('{a => fetch(1), b => fetch(2)}'))
+        self.assertEqual(
+            {'a': 2, 'b': 4}, evaluate('dict(a => fetch(1), b => fetch(2))'))
+        self.assertEqual(2, max_active[0])
+
+        max_active[0] = 0
+        self.assertEqual(
+            [0, 2, 4, 6], evaluate('$.select(fetch($))', data=[0, 1, 2, 3]))
+        self.assertLess(1, max_active[0])
+
+        self.assertEqual(8, evaluate('fetch(fetch($))', data=2))
+        self.assertEqual(6, self.eval('fetch($)', data=3, context=context))
+
+        async def evaluate_in_loop():
+            return self.eval('fetch($)', data=4, context=context)
+
+        self.assertEqual(8, asyncio.run(evaluate_in_loop()))
+        self.assertRaises(
+            exceptions.NoMatchingFunctionException,
+            evaluate, 'fetch(1, 2)')
@@ -12,11 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import io
+import itertools
+import json
 import tempfile
 
 from yaql.cli.cli_functions import load_data
 from yaql.language import exceptions
 from yaql.language import specs
+from yaql.language import utils
 from yaql.language import yaqltypes
 import yaql.tests
 
@@ -110,3 +114,71 @@ class TestMiscellaneous(yaql.tests.TestCase):
             f.flush()
             self.assertIsNone(load_data(f.name, context))
             self.assertEqual(context['$'], {"foo": "bar"})
+
+    def test_loads_json(self):
+        text = ('{"a": [1, [2, {"b": []}]], "c": {"d": null}, '
+                '"e": "f", "g": [{"h": 1.5}]}')
+        data = utils.loads_json(text)
+        self.assertEqual(utils.convert_input_data(json.loads(text)), data)
+        self.assertIsInstance(data, utils.FrozenDict)
+        self.assertIsInstance(data['a'], tuple)
+        self.assertIsInstance(data['a'][1], tuple)
+        self.assertIsInstance(data['a'][1][1], utils.FrozenDict)
+        self.assertIsInstance(data['g'][0], utils.FrozenDict)
+        self.assertEqual((1, (2, 3)), utils.loads_json('[1, [2, 3]]'))
+        self.assertEqual(1, utils.loads_json('1'))
+        self.assertEqual(3, self.eval('$.a[1][1].b.len() + 3', data=data))
+
+    def test_load_json_lines(self):
+        text = '{"a": 1}\n\n[1, 2]\nnot JSON\n{"a": 3}\n'
+        errors = []
+        data = utils.load_json_lines(
+            io.StringIO(text), lambda number, e: errors.append(number))
+        self.assertEqual(
+            [{'a': 1}, (1, 2), {'a': 3}], list(data))
+        self.assertEqual([4], errors)
+        data = utils.load_json_lines(io.StringIO(text))
+        self.assertEqual({'a': 1}, next(data))
+        self.assertEqual((1, 2), next(data))
+        self.assertRaisesRegex(ValueError, '^Line 4: ', next, data)
+
+    def test_stream(self):
+        stream = self.engine('$.where($.a > 1).select([$.a])').stream(
+            data=utils.load_json_lines(
+                io.StringIO('{"a": 1}\n{"a": 2}\n{"a": 3}\n')),
+            context=self.context)
+        self.assertEqual([[2], [3]], list(stream))
+
+        stream = self.engine('$.select($ * 2)').stream(
+            data=itertools.count(), context=self.context)
+        self.assertEqual([0, 2, 4], list(itertools.islice(stream, 3)))
+        self.assertEqual(
+            [{'a': [1]}],
+            list(self.engine('{a => [1]}').stream(context=self.context)))
+        self.assertEqual(
+            [3], list(self.engine('1 + 2').stream(context=self.context)))
+
+    def test_memoized_lambda(self):
+        @specs.parameter('func', yaqltypes.Lambda(memoize=True))
+        def call_twice(func, arg1, arg2):
+            return func(arg1) is func(arg2), func(arg1)
+
+        def foo(arg):
+            return arg
+
+        context = self.context.create_child_context()
+        context.register_function(call_twice)
+        context.register_function(foo)
+
+        self.assertEqual(
+            [True, [1]], self.eval('callTwice([$], 1, 1)', context=context))
+        self.assertEqual(
+            [True, [[1, {'a': 2}]]],
+            self.eval('callTwice([$], [1, {a => 2}], [1, {a => 2}])',
+                      context=context))
+        self.assertEqual(
+            [False, 0], self.eval('callTwice($ / 2, 1, 1.0)', context=context))
+        for expr in ('[$, random()]', '[$, now()]', '[$, localtz()]',
+                     '[$, foo($)]'):
+            self.assertFalse(self.eval(
+                'callTwice({0}, 1, 1)'.format(expr), context=context)[0])
@@ -12,7 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
+import testtools
+
+from yaql.language import columnar
 from yaql.language import exceptions
+from yaql.language import factory
+from yaql.language import specs
+from yaql.language import utils
+from yaql.language import yaqltypes
 import yaql.tests
 
 
@@ -39,6 +48,62 @@ class TestQueries(yaql.tests.TestCase):
         self.assertEqual([1, 2], self.eval('$.limit(2)', data=data))
         self.assertEqual([1, 2], self.eval('$.take(2)', data=data))
 
+    def test_sequence_slice_views(self):
+        engine = self.engine.copy({'yaql.limitIterators': -1})
+        data = tuple(range(1000))
+        view = self.context('skip', engine, data)(900)
+        self.assertIsInstance(view, utils.SliceView)
+        self.assertIs(data, view.sequence)
+        self.assertEqual(100, len(view))
+        self.assertEqual((999, 990), (view[-1], view[90]))
+        self.assertEqual([902, 903], list(view[2:4]))
+        self.assertIs(data, view[2:4].sequence)
+        self.assertRaises(IndexError, view.__getitem__, 100)
+        self.assertEqual(50, engine(
+            '$.skip(10).take(60).skip(10).len()').evaluate(
+            data=data, context=self.context))
+        self.assertEqual(955, engine(
+            '$.skip(900).limit(60).skip(55).first()').evaluate(
+            data=data, context=self.context))
+        self.assertEqual([997, 998, 999], engine(
+            '$.skip(997).take(50)').evaluate(
+            data=data, context=self.context))
+        self.assertEqual([], engine('$.skip(2000)').evaluate(
+            data=data, context=self.context))
+        self.assertEqual([3, 2], self.eval('[1, 2, 3].skip(1).reverse()'))
+        self.assertEqual(
+            [2, 3, 4], self.eval('list([1, 2, 3].skip(1), 4)'))
+        self.assertEqual(
+            [[2, 3], [4]], self.eval('[1, 2, 3, 4].skip(1).slice(2)'))
+        self.assertEqual((902, 903), view[2:4])
+        self.assertEqual(hash((902, 903)), hash(view[2:4]))
+
+    def test_slice_views_are_lists(self):
+        for expr in ('[1, 2, 3].skip(1)', '[1, 2, 3].limit(2)',
+                     '[1, 2, 3].take(2)', '[1, 2, 3].slice(2).first()'):
+            self.assertTrue(self.eval('isList({0})'.format(expr)), expr)
+            self.assertTrue(self.eval('isIterable({0})'.format(expr)), expr)
+        for expr in ('[1, 2, 3].select($).skip(1)',
+                     '[1, 2, 3].select($).limit(2)'):
+            self.assertFalse(self.eval('isList({0})'.format(expr)), expr)
+            self.assertTrue(self.eval('isIterable({0})'.format(expr)), expr)
+
+    def test_slice_chunks_compare_as_lists(self):
+        for expr, expected in [
+                ('[1, 2, 1, 2].slice(2).distinct()', [[1, 2]]),
+                ('[1, 2].slice(2).select($ = [1, 2])', [True]),
+                ('[1, 2, 1, 2].slice(2).groupBy($).len()', 1),
+                ('[1, 2, 3, 4].slice(2).contains([3, 4])', True),
+                ('set([1, 2, 1, 2].slice(2))', [[1, 2]]),
+                ('[1, 2, 3, 1, 2].splitWhere($ = 3).distinct()', [[1, 2]]),
+                ('[1, 1, 2, 1, 1].sliceWhere($ = 2).distinct()',
+                 [[1, 1], [2]]),
+                ('[0, 1, 2, 1, 2].skip(1).slice(2).distinct()', [[1, 2]]),
+                ('[[0, 1, 2], [5, 1, 2]].select($.skip(1)).distinct()',
+                 [[1, 2]]),
+                ('[0, 1, 2].skip(1) in [[1, 2]]', True)]:
+            self.assertEqual(expected, self.eval(expr), expr)
+
     def test_append(self):
         data = [1, 2]
         self.assertEqual([1, 2, 3, 4], self.eval('$.append(3, 4)', data=data))
@@ -113,6 +178,175 @@ class TestQueries(yaql.tests.TestCase):
         self.assertEqual(6, self.eval('$.sum()', data=data))
         self.assertEqual(106, self.eval('$.sum(100)', data=data))
         self.assertEqual(100, self.eval('[].sum(100)'))
+        self.assertEqual(4.5, self.eval('[1, 2.5, 1].sum()'))
+        self.assertEqual('ab', self.eval('[a, b].sum()'))
+        self.assertEqual('cab', self.eval('[a, b].sum(c)'))
+        self.assertRaises(
+            exceptions.NoMatchingFunctionException,
+            self.eval, '[a, b, [1]].sum()')
+        self.assertRaises(
+            exceptions.NoMatchingFunctionException,
+            self.eval, '[1, true].sum()')
+
+    def test_sum_overridden_operator(self):
+        @specs.parameter('left', int)
+        @specs.parameter('right', int)
+        @specs.name('#operator_+')
+        def plus(left, right):
+            return left * right
+
+        context = self.context.create_child_context()
+        context.register_function(plus)
+        self.assertEqual(24, self.eval('[1, 2, 3, 4].sum()', context=context))
+
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    def test_columnar(self):
+        engine = factory.YaqlFactory().create(options=dict(
+            self.engine_options, **{'yaql.columnar': True}))
+        data = [{'value': v, 'w': 1.5 * v, 'k': v % 3}
+                for v in (120, 7, 300, -5, 101, 42, 100)]
+        for expr in [
+                '$.where($.value > 100).select($.value * 8).sum()',
+                '$.where($.value > 100).select($.value * 8)',
+                '$.where($.value >= 100 and not $.k = 0).count()',
+                '$.where($.value < 0 or $.w > 400).select($.w).max()',
+                '$.select($.value / 3 - $.k).min()',
+                '$.select($.w / 3).sum()',
+                '$.select(-$.value + $.w).where($ > 0).select($ * 2).sum()',
+                '$.where($.value > 1000).count()',
+                '$.select($.value).sum(1)',
+                '$.select($.value > 100).count()']:
+            expected = self.eval(expr, data=data)
+            result = engine(expr).evaluate(data=data, context=self.context)
+            self.assertEqual(expected, result, expr)
+            self.assertIs(type(expected), type(result), expr)
+        self.assertRaises(
+            ZeroDivisionError,
+            engine('$.select($.value / $.k).sum()').evaluate,
+            data=data, context=self.context)
+        self.assertRaises(
+            KeyError,
+            engine('$.where($.missing > 1).count()').evaluate,
+            data=data, context=self.context)
+
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    def test_columnar_query(self):
+        engine = factory.YaqlFactory().create(options=dict(
+            self.engine_options, **{'yaql.columnar': True}))
+        queries = []
+
+        @specs.parameter('query', columnar.ColumnarQuery)
+        def capture(query):
+            queries.append(query)
+
+        context = self.context.create_child_context()
+        context.register_function(capture)
+
+        def query(expr, data):
+            engine('capture({0})'.format(expr)).evaluate(
+                data=data, context=context)
+            return queries.pop()
+
+        data = [{'a': 1}, {'a': 2}, {'a': 3}]
+        q = query('$.where($.a > 1).select($.a * 2)', data)
+        self.assertEqual(10, q.sum(context))
+        self.assertEqual([], list(q))
+        self.assertEqual(
+            4, query('$.where($.a > 1).select($.a * 2)', data).min(context))
+        self.assertEqual(
+            2, query('$.where($.a > 1).select($.a * 2)', data).count(context))
+        q = query('$.where($.a > 1).select($.a * 2)', data)
+        self.assertEqual(4, next(q))
+        self.assertIs(utils.NO_VALUE, q.sum(context))
+        self.assertEqual([6], list(q))
+
+        for data in ([{'a': 1}, {'a': 2.5}], [{'a': True}], [{'b': 1}],
+                     [{'a': 2 ** 63}], [{'a': float('nan')}], [1, 2]):
+            q = query('$.select($.a)', data)
+            self.assertIs(utils.NO_VALUE, q.max(context))
+        q = query('$.select($.a * $.a * $.a)', [{'a': 2 ** 30}])
+        self.assertIs(utils.NO_VALUE, q.sum(context))
+        self.assertEqual(
+            2 ** 90, engine('$.select($.a * $.a * $.a).sum()').evaluate(
+                data=[{'a': 2 ** 30}], context=context))
+
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    def test_columnar_sinks(self):
+        engine = factory.YaqlFactory().create(options=dict(
+            self.engine_options, **{'yaql.columnar': True}))
+        data = [{'v': 1}, {'v': 2}, {'v': 3}]
+        for expr, expected in [
+                ('$.select($.v).len()', 3),
+                ('len($.where($.v > 1))', 2),
+                ('$.select($.v).first()', 1),
+                ('$.where($.v > 1).toList()', [{'v': 2}, {'v': 3}]),
+                ('$.where($.v > 2).any()', True),
+                ('let($.select($.v)) -> [$.sum(), $.sum(0)]', [6, 0]),
+                ('let($.select($.v)) -> [$.first(), $.sum()]', [1, 5]),
+                ('let($.select($.v)) -> [$.where($ > 1).sum(), $.len()]',
+                 [5, 0]),
+                ('let($.select($.v)) -> [$.first(), $.select($ * 2).sum()]',
+                 [1, 10])]:
+            self.assertEqual(expected, self.eval(expr, data=data), expr)
+            self.assertEqual(
+                expected,
+                engine(expr).evaluate(data=data, context=self.context), expr)
+
+    def test_parallel_select_where(self):
+        engine = factory.YaqlFactory().create(options=dict(
+            self.engine_options, **{'yaql.parallelWorkers': 2}))
+
+        def eval(expr, data=None, context=None):
+            return engine(expr).evaluate(
+                data=data, context=context or self.context)
+
+        data = list(range(10))
+        self.assertEqual(
+            [t * t for t in data],
+            eval('$.parallelSelect($ * $, chunkSize => 3)', data))
+        self.assertEqual(
+            [0, 3, 6, 9],
+            eval('$.parallelWhere($ mod 3 = 0, 2)', data))
+        self.assertCountEqual(
+            [[t, list(range(t))] for t in data],
+            eval('$.parallelSelect([$, range($)], 4, false)', data))
+        self.assertEqual(
+            [3, 6], eval('let(k => 3) -> [1, 2].parallelSelect($ * $k)'))
+        self.assertEqual(
+            [{'a': 1}, {'a': 2}], eval('[1, 2].parallelSelect(dict(a => $))'))
+        self.assertRaises(
+            exceptions.MethodResolutionError,
+            eval, '[1, 2].parallelSelect($.foo())')
+        e = self.assertRaises(
+            exceptions.NoFunctionRegisteredException,
+            eval, '[1, 2].parallelSelect($.foo)')
+        self.assertEqual('Unknown function "#property#foo"', str(e))
+        self.assertRaises(
+            ZeroDivisionError, eval, '[1, 2].parallelWhere(1 / ($ - 2) > 0)')
+
+        @specs.parameter('x', int)
+        def foo(x):
+            return -x
+
+        context = self.context.create_child_context()
+        context.register_function(foo)
+        self.assertEqual(
+            [-1, -2], eval('[1, 2].parallelSelect(foo($))', context=context))
+        self.assertEqual(
+            [[1, 2], [2, 4]],
+            eval('[1, 2].parallelSelect(dict(a => $, b => 2 * $).values())',
+                 context=self.legacy_context))
+
+    def test_avg(self):
+        self.assertEqual(2.5, self.eval('[3, 1, 2, 4].avg()'))
+        self.assertEqual(0.5, self.eval('[0.25, 0.75].avg()'))
+        self.assertIsNone(self.eval('[].avg()'))
+        self.assertEqual([1.5, 1], self.eval('[[1, 2].avg(), 3 / 2]'))
+        self.assertIs(float, type(self.eval('[1, 3].avg()')))
+        self.assertEqual(
+            [['a', 2.0], ['b', 3.0]],
+            self.eval('$.groupBy($[0], $[1], $.avg())',
+                      data=[['a', 1], ['b', 3], ['a', 3]]))
 
     def test_memorize(self):
         generator_func = lambda: (i for i in range(3))  # noqa: E731
@@ -194,6 +428,66 @@ class TestQueries(yaql.tests.TestCase):
                 '$.orderByDescending($[0]).thenByDescending($[1])',
                 data=[[2, 2], [1, 5], [1, 0]]))
 
+    def test_order_by_is_stable(self):
+        data = [['b', 1, 'x'], ['a', 2.5, 'y'], ['b', 1, 'z'],
+                ['a', 1, 'w'], ['b', 0, 'v']]
+        self.assertEqual(
+            ['y', 'w', 'x', 'z', 'v'],
+            self.eval('$.orderBy($[0]).thenByDescending($[1]).select($[2])',
+                      data=data))
+        self.assertEqual(
+            ['v', 'x', 'z', 'w', 'y'],
+            self.eval('$.orderByDescending($[0]).thenBy($[1]).select($[2])',
+                      data=data))
+
+    def test_order_by_mixed_keys(self):
+        self.assertEqual(
+            [None, 1, 2.5, 3],
+            self.eval('$.orderBy($)', data=[3, None, 2.5, 1]))
+        self.assertEqual(
+            [[1, 'b'], [1, 'a'], [2, 'c']],
+            self.eval('$.orderBy($[0]).thenByDescending($[1])',
+                      data=[[2, 'c'], [1, 'a'], [1, 'b']]))
+        self.assertEqual(
+            [None, 'a', 'b'],
+            self.eval('$.orderBy($)', data=['b', None, 'a']))
+
+    def test_order_by_limit(self):
+        data = [[3, 'a'], [1, 'b'], [2, 'c'], [1, 'd'], [3, 'e'], [1, 'f']]
+        self.assertEqual(
+            ['b', 'd'],
+            self.eval('$.orderBy($[0]).take(2).select($[1])', data=data))
+        self.assertEqual(
+            ['a', 'e', 'c'],
+            self.eval('$.orderByDescending($[0]).limit(3).select($[1])',
+                      data=data))
+        self.assertEqual(
+            ['f', 'd', 'b', 'c'],
+            self.eval('$.orderBy($[0]).thenByDescending($[1]).take(4)'
+                      '.select($[1])', data=data))
+        self.assertEqual(
+            [None, 1],
+            self.eval('$.orderBy($).limit(2)', data=[3, None, 2.5, 1]))
+        self.assertEqual([], self.eval('[3, 1].orderBy($).limit(0)'))
+        self.assertEqual([1, 3], self.eval('[3, 1].orderBy($).limit(5)'))
+
+    def test_order_by_first(self):
+        self.assertEqual(
+            [1, 'b'],
+            self.eval('$.orderBy($[0]).first()',
+                      data=[[2, 'a'], [1, 'b'], [1, 'c']]))
+        self.assertEqual(
+            'c', self.eval('$.orderByDescending($).first()',
+                           data=['a', 'c', 'b']))
+        self.assertIsNone(self.eval('[].orderBy($).first(null)'))
+        self.assertRaises(StopIteration, self.eval, '[].orderBy($).first()')
+
+    def test_order_by_datetime(self):
+        self.assertEqual(
+            [2010, 2011, 2012],
+            self.eval('$.select(datetime($, 1, 1)).orderBy($).select($.year)',
+                      data=[2012, 2010, 2011]))
+
     def test_group_by(self):
         data = {'a': 1, 'b': 2, 'c': 1, 'd': 3, 'e': 2}
         self.assertCountEqual(
@@ -226,6 +520,55 @@ class TestQueries(yaql.tests.TestCase):
                       'groupBy($[1], aggregator => $.sum())',
                       data=data))
 
+    def test_group_by_accumulators(self):
+        data = [['a', 3], ['b', 2], ['a', 1], ['b', 2], ['a', 5]]
+        for aggregator, expected in [
+                ('$.count()', [['a', 3], ['b', 2]]),
+                ('len($)', [['a', 3], ['b', 2]]),
+                ('$.sum()', [['a', 9], ['b', 4]]),
+                ('$.min()', [['a', 1], ['b', 2]]),
+                ('$.max()', [['a', 5], ['b', 2]]),
+                ('$.first()', [['a', 3], ['b', 2]]),
+                ('$.last()', [['a', 5], ['b', 2]]),
+                ('$.distinct().count()', [['a', 3], ['b', 1]]),
+                ('count', [['a', 3], ['b', 2]]),
+                ('avg', [['a', 3.0], ['b', 2.0]]),
+                ('distinctCount', [['a', 3], ['b', 1]])]:
+            self.assertEqual(
+                expected,
+                self.eval('$.groupBy($[0], $[1], {0})'.format(aggregator),
+                          data=data))
+
+    def test_group_by_overridden_aggregator(self):
+        @specs.parameter('collection', yaqltypes.Iterable())
+        @specs.method
+        def count(collection):
+            return -1
+
+        context = self.context.create_child_context()
+        context.register_function(count)
+        self.assertEqual(
+            [['a', -1], ['b', -1]],
+            self.eval('$.groupBy($[0], $[1], $.count())',
+                      data=[['a', 1], ['b', 2]], context=context))
+        self.assertEqual(
+            [['a', 'count'], ['b', 'count']],
+            self.eval('$.groupBy($[0], $[1], count)',
+                      data=[['a', 1], ['b', 2]], context=context))
+
+        @specs.parameter('collection', yaqltypes.Iterable())
+        @specs.name('sum')
+        @specs.method
+        def sum_(collection):
+            return 0
+
+        context.register_function(sum_)
+        for aggregator in ('sum', '$.sum()'):
+            self.assertEqual(
+                [['a', 'sum' if aggregator == 'sum' else 0]],
+                self.eval('$.groupBy($[0], $[1], {0})'.format(aggregator),
+                          data=[['a', 1], ['a', 2]], context=context))
+
     def test_group_by_old_syntax(self):
         # Test the syntax used in 1.1.1 and earlier, where the aggregator
         # function was passed the key as well as the value list, and returned
@@ -259,6 +602,68 @@ class TestQueries(yaql.tests.TestCase):
             [[1, 3], [1, 4], [2, 3], [2, 4]],
             self.eval('[1,2].join([3, 4], true, [$1, $2])'))
 
+    def test_join_equality(self):
+        data = {
+            'users': [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'},
+                      {'id': 3, 'name': 'c'}],
+            'items': [{'owner': 2, 'v': 'x'}, {'owner': 1, 'v': 'y'},
+                      {'owner': 2, 'v': 'z'}]
+        }
+        expected = [['a', 'y'], ['b', 'x'], ['b', 'z']]
+        self.assertEqual(
+            expected,
+            self.eval('$.users.join($.items, $1.id = $2.owner, '
+                      '[$1.name, $2.v])', data=data))
+        self.assertEqual(
+            expected,
+            self.eval('$.users.join($.items, $2.owner = $1.id, '
+                      '[$1.name, $2.v])', data=data))
+        self.assertEqual(
+            [[2, 1], [3, 2]],
+            self.eval('[1, 2, 3].join([1, 2, 5], $1 = $2 + 1, [$1, $2])'))
+        self.assertEqual(
+            [[2, 1], [3, 2]],
+            self.eval('[1, 2, 3].join([1, 2, 5], $ = $2 + 1, [$1, $2])'))
+        self.assertEqual(
+            [], self.eval('[1, 2].join([], $1 = $2, [$1, $2])'))
+        # the right side is not read when the left one is empty
+        self.assertEqual(
+            [], self.eval('[].join(sequence(), $1 = $2, [$1, $2])'))
+
+        # keys calling host functions are evaluated for every pair
+        calls = []
+
+        def key(x):
+            calls.append(x)
+            return x
+
+        context = self.context.create_child_context()
+        context.register_function(key)
+        self.assertEqual(
+            [[1, 1], [2, 2]],
+            self.eval('[1, 2].join([1, 2], $1 = key($2), [$1, $2])',
+                      context=context))
+        self.assertEqual(4, len(calls))
+
+    def test_join_on(self):
+        data = {
+            'users': [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'},
+                      {'id': 3, 'name': 'c'}],
+            'items': [{'owner': 2, 'v': 'x'}, {'owner': 1, 'v': 'y'},
+                      {'owner': 2, 'v': 'z'}]
+        }
+        self.assertEqual(
+            [['a', 'y'], ['b', 'x'], ['b', 'z']],
+            self.eval('$.users.joinOn($.items, $.id, $.owner, '
+                      '[$1.name, $2.v])', data=data))
+        self.assertEqual(
+            [['a', 'y'], ['b', 'x'], ['b', 'z'], ['c', None]],
+            self.eval('$.users.leftJoinOn($.items, $.id, $.owner, '
+                      '[$1.name, $2?.v])', data=data))
+        self.assertEqual(
+            [[[1], [1]]],
+            self.eval('[[1], [2]].joinOn([[1], [3]], $, $, [$1, $2])'))
+
     def test_zip(self):
         self.assertEqual(
             [[1, 4], [2, 5]],
@@ -358,6 +763,13 @@ class TestQueries(yaql.tests.TestCase):
             1,
             self.eval('[].aggregate($1 + $2, 1)'))
 
+        self.assertEqual(
+            'xabc', self.eval('[a, b, c].aggregate($1 + $2, x)'))
+        self.assertEqual(
+            'cba', self.eval('[a, b, c].aggregate($2 + $1)'))
+        self.assertEqual(
+            [1, 2], self.eval('[[1], [2]].aggregate($1 + $2)'))
+
         self.assertEqual(
             'aabaa',
             self.eval('[a,a,b,a,a].reduce($1 + $2)'))
@@ -375,6 +787,80 @@ class TestQueries(yaql.tests.TestCase):
             [1],
             self.eval('[].accumulate($1 + $2, 1)'))
 
+    def test_window(self):
+        self.assertEqual(
+            [[1, 2, 3], [2, 3, 4], [3, 4, 5]],
+            self.eval('[1, 2, 3, 4, 5].window(3)'))
+        self.assertEqual(
+            [[1, 2], [3, 4]], self.eval('[1, 2, 3, 4, 5].window(2, 2)'))
+        self.assertEqual(
+            [[1, 2], [4, 5]], self.eval('[1, 2, 3, 4, 5].window(2, 3)'))
+        self.assertEqual([], self.eval('[1, 2].window(3)'))
+        self.assertEqual(
+            [[0, 1], [1, 2]], self.eval('sequence().window(2).take(2)'))
+        self.assertRaises(ValueError, self.eval, '[1, 2].window(0)')
+
+    def test_rolling_aggregates(self):
+        data = [3, -1, 4, 1, -5, 9, 2, -6, 5, 3]
+        for size in (1, 2, 3, 7, 10):
+            windows = [data[i:i + size]
+                       for i in range(len(data) - size + 1)]
+            self.assertEqual(
+                [sum(t) for t in windows],
+                self.eval('$.rollingSum({0})'.format(size), data=data))
+            self.assertEqual(
+                [sum(t) / size for t in windows],
+                self.eval('$.rollingAvg({0})'.format(size), data=data))
+            self.assertEqual(
+                [max(t) for t in windows],
+                self.eval('$.rollingMax({0})'.format(size), data=data))
+            self.assertEqual(
+                [min(t) for t in windows],
+                self.eval('$.rollingMin({0})'.format(size), data=data))
+        self.assertEqual(
+            ['ab', 'bc', 'cd'], self.eval('[a, b, c, d].rollingSum(2)'))
+        self.assertEqual([], self.eval('[1, 2].rollingMax(3)'))
+
+    def test_time_window(self):
+        expr = ('$.select([datetime(2020, 1, 1, 0, $), $])'
+                '.timeWindow($[0], timespan(minutes => 5){0})'
+                '.select($.select($[1]))')
+        data = [0, 2, 4, 6, 8, 30, 31]
+        self.assertEqual(
+            [[0, 2, 4], [6, 8], [30, 31]],
+            self.eval(expr.format(''), data=data))
+        self.assertEqual(
+            [[0, 2, 4], [2, 4, 6], [4, 6, 8], [6, 8], [8],
+             [30], [30, 31], [30, 31]],
+            self.eval(expr.format(', timespan(minutes => 2)'), data=data))
+        self.assertEqual([], self.eval(expr.format(''), data=[]))
+        self.assertRaises(
+            ValueError, self.eval, expr.format(''), data=[2, 1])
+
+    def test_index_by(self):
+        data = {
+            'vms': [{'id': 1}, {'id': 2}, {'id': 3}],
+            'ports': [{'deviceId': 1, 'name': 'a'},
+                      {'deviceId': 3, 'name': 'b'},
+                      {'deviceId': 1, 'name': 'c'}]
+        }
+        self.assertEqual(
+            [['a', 'c'], [], ['b']],
+            self.eval('let(ports => $.ports.indexBy($.deviceId, $.name)) -> '
+                      '$.vms.select($ports.get($.id))', data=data))
+        self.assertEqual(
+            [True, False, False],
+            self.eval('let(idx => $.ports.lookup($.deviceId)) -> '
+                      '[$idx.contains(3), $idx.contains(2), '
+                      '$idx.contains(null)]', data=data))
+        self.assertEqual(
+            {1: [1, 3], 0: [2, 4]}, self.eval('[1, 2, 3, 4].indexBy($ mod 2)'))
+        self.assertCountEqual(
+            [0, 1], self.eval('[1, 2, 3, 4].indexBy($ mod 2).keys()'))
+        self.assertEqual(
+            [[1, 2]], self.eval('[[1, 2], [3]].indexBy($).get([1, 2])'))
+        self.assertIsNone(self.eval('{a => 1}.get(b)'))
+
     def test_default_if_empty(self):
         self.assertEqual(
             [1, 2],
@@ -443,6 +929,12 @@ class TestQueries(yaql.tests.TestCase):
             234,
             self.eval('[44, 234, 23].max()'))
 
+        self.assertIsInstance(self.eval('[1.0, 1, 0].max()'), float)
+        self.assertEqual(
+            2012,
+            self.eval('[datetime(2010, 1, 1), datetime(2012, 1, 1)].max()'
+                      '.year'))
+
     def test_min(self):
         self.assertEqual(
             0,
@@ -456,6 +948,11 @@ class TestQueries(yaql.tests.TestCase):
             23,
             self.eval('[44, 234, 23].min()'))
 
+        self.assertIsInstance(self.eval('[1, 1.0, 2].min()'), float)
+        self.assertRaises(
+            exceptions.NoMatchingFunctionException,
+            self.eval, '[1, datetime(2010, 1, 1)].min()')
+
     def test_reverse(self):
         self.assertEqual(
             [9, 4, 1],
@@ -534,3 +1031,236 @@ class TestQueries(yaql.tests.TestCase):
         self.assertRaises(
             exceptions.CollectionTooLargeException,
             self.eval, 'set(sequence())')
+
+    def test_memory_quota(self):
+        self.assertRaises(
+            exceptions.MemoryQuotaExceededException,
+            self.eval, 'range(100).select(str($) * 200).distinct()')
+        self.assertRaises(
+            exceptions.MemoryQuotaExceededException,
+            self.eval, 'range(100).groupBy($ mod 3, str($) * 200)')
+        self.assertEqual(
+            100, self.eval('range(100).select(str($) * 20).distinct().len()'))
+
+    def test_memory_quota_released(self):
+        engine = self.engine.copy({
+            'yaql.limitIterators': -1,
+            'yaql.memoryQuota': 100000
+        })
+        for expr, expected in [
+                ('range(10).groupBy($ mod 2).len()', 4000),
+                ('range(10).groupBy($ mod 2, aggregator => sum).len()', 4000),
+                ('range(10).memorize().len()', 20000),
+                ('range(10).indexBy($ mod 2).get(1).len()', 10000),
+                ('range(10).distinct().len()', 20000)]:
+            self.assertEqual(expected, engine(
+                'range(2000).select({}).sum()'.format(expr)).evaluate(
+                    context=self.context))
+
+    def test_memory_accountant_report(self):
+        accountant = utils.MemoryAccountant(-1)
+        self.context['#memoryAccountant'] = accountant
+        self.assertEqual(
+            50, self.eval('range(50).select(str($) * 10).distinct().len()'))
+        report = accountant.report()
+        self.assertEqual(0, report['usage'])
+        self.assertGreater(report['peak'], 50 * 59)
+
+    def test_limit_iterable(self):
+        iterator = utils.limit_iterable(iter(range(3)), 3)
+        self.assertIsInstance(iterator, utils.LimitedIterator)
+        self.assertIs(iterator, utils.limit_iterable(iterator, 3))
+        self.assertEqual([0, 1, 2], list(iterator))
+        self.assertRaises(
+            exceptions.CollectionTooLargeException,
+            list, utils.limit_iterable(iter(range(4)), 3))
+        iterator = iter(range(4))
+        self.assertIs(iterator, utils.limit_iterable(iterator, -1))
+
+        # stricter limits wrap again, the source is read lazily
+        iterator = utils.limit_iterable(iter(range(3)), 5)
+        self.assertIs(iterator, utils.limit_iterable(iterator, 10))
+        stricter = utils.limit_iterable(iterator, 2)
+        self.assertIsNot(iterator, stricter)
+        self.assertRaises(
+            exceptions.CollectionTooLargeException, list, stricter)
+        consumed = []
+        source = (consumed.append(t) or t for t in range(3))
+        iterator = utils.limit_iterable(source, 3)
+        self.assertEqual([], consumed)
+        self.assertEqual(0, next(iterator))
+
+        # re-iterable iterators keep their position
+        memorized = utils.memorize(iter(range(4)), self.engine)
+        next(memorized)
+        self.assertEqual(
+            [1, 2, 3], list(utils.limit_iterable(memorized, 3)))
+        self.assertEqual(
+            [0, 2, 4],
+            self.eval('sequence().where($ mod 2 = 0).take(3)'))
+
+    def test_memorize_spill(self):
+        engine = self.engine.copy({
+            'yaql.spillThreshold': 1000,
+            'yaql.limitIterators': -1,
+            'yaql.memoryQuota': -1
+        })
+        self.assertEqual(
+            1000 + 999 * 500,
+            engine('let(range(1000).memorize()) -> $.len() + $.sum()'
+                   ).evaluate(context=self.context))
+        self.assertEqual(
+            [[i, i] for i in range(0, 1000, 100)],
+            engine('range(0, 1000, 100).join(range(1000).select([$]), '
+                   '$1 = $2[0], [$1, $2[0]])').evaluate(context=self.context))
+
+    def test_order_by_external(self):
+        options = {
+            'yaql.limitIterators': -1,
+            'yaql.memoryQuota': -1
+        }
+        in_memory = self.engine.copy(options)
+        engine = self.engine.copy(dict(options, **{'yaql.spillThreshold': 1}))
+        data = [{'a': i % 7, 'b': i % 13, 'c': i} for i in range(1000)]
+        for expr in ('$.orderBy($.a)',
+                     '$.orderBy($.a).thenByDescending($.b)',
+                     '$.orderByDescending($.b).thenBy($.a).thenBy($.c)'):
+            self.assertEqual(
+                in_memory(expr).evaluate(data=data, context=self.context),
+                engine(expr).evaluate(data=data, context=self.context))
+
+        # sorted runs are merged again when iterated once more
+        expr = ('let(x => $.select($).orderBy(-$)) -> '
+                '[$x.toList(), $x.take(2), $x.first(), $x.take(2).first()]')
+        expected = [list(range(999, -1, -1)), [999, 998], 999, 999]
+        self.assertEqual(expected, in_memory(expr).evaluate(
+            data=list(range(1000)), context=self.context))
+        self.assertEqual(expected, engine(expr).evaluate(
+            data=list(range(1000)), context=self.context))
+
+        # elements that cannot be pickled are sorted in memory
+        locks = [threading.Lock() for _ in range(100)]
+        data = [{'k': i % 10, 'lock': lock} for i, lock in enumerate(locks)]
+        result = engine('$.orderBy($.k)').evaluate(
+            data=data, context=self.context)
+        self.assertEqual(sorted(i % 10 for i in range(100)),
+                         [t['k'] for t in result])
+        self.assertEqual(
+            [locks[i] for i in sorted(range(100), key=lambda i: i % 10)],
+            [t['lock'] for t in result])
+
+    def test_order_by_external_keeps_objects(self):
+        # collections below the threshold and the last run are not pickled
+        class Item:
+            def __init__(self, k):
+                self.k = k
+
+        def key(item):
+            return item.k
+
+        context = self.context.create_child_context()
+        context.register_function(key)
+        data = [Item(i % 5) for i in range(50)]
+        expected = sorted(data, key=key)
+
+        engine = self.engine.copy({'yaql.spillThreshold': 10 ** 6})
+        result = engine('$.orderBy(key($))').evaluate(
+            data=data, context=context)
+        self.assertEqual(len(expected), len(result))
+        for a, b in zip(expected, result):
+            self.assertIs(a, b)
+
+        engine = self.engine.copy({'yaql.spillThreshold': 1000})
+        result = engine('$.orderBy(key($))').evaluate(
+            data=data, context=context)
+        self.assertEqual([t.k for t in expected], [t.k for t in result])
+        self.assertIs(expected[-1], result[-1])
+
+    def test_group_by_distinct_spill(self):
+        options = {
+            'yaql.limitIterators': -1,
+            'yaql.memoryQuota': -1
+        }
+        in_memory = self.engine.copy(options)
+        engine = self.engine.copy(dict(options, **{
+            'yaql.spillThreshold': 1000,
+            'yaql.spillPartitions': 4
+        }))
+        data = [{'k': (i * 7) % 150, 'v': i} for i in range(600)]
+        for expr in ('$.groupBy($.k, $.v)',
+                     '$.groupBy($.k, $.v, $.sum())',
+                     '$.groupBy($.k, $.v, max)',
+                     '$.groupBy($.k mod 3, $.v, count)'):
+            expected = in_memory(expr).evaluate(
+                data=data, context=self.context)
+            result = engine(expr).evaluate(data=data, context=self.context)
+            self.assertEqual(len(expected), len(result))
+            self.assertCountEqual(expected, result)
+
+        expected = in_memory('$.distinct($.k)').evaluate(
+            data=data, context=self.context)
+        result = engine('$.distinct($.k)').evaluate(
+            data=data, context=self.context)
+        self.assertEqual(150, len(result))
+        self.assertCountEqual(expected, result)
+        self.assertNotEqual(expected, result)
+        self.assertEqual(
+            list(range(150)),
+            sorted(engine('$.distinct()').evaluate(
+                data=[i % 150 for i in range(600)], context=self.context)))
+
+        # elements that cannot be pickled are kept in memory
+        locks = [threading.Lock() for _ in range(150)]
+        result = engine('$.groupBy($.k, $.lock)').evaluate(
+            data=[{'k': i, 'lock': lock} for i, lock in enumerate(locks)],
+            context=self.context)
+        self.assertCountEqual([[i, [lock]] for i, lock in enumerate(locks)],
+                              result)
+
+    def test_memorizing_buffer(self):
+        for threshold in (0, 5000):
+            engine = self.engine.copy({'yaql.spillThreshold': threshold})
+            buffer = utils.MemorizingBuffer(
+                ({'a': i} for i in range(1000)), engine, chunk_size=10)
+            reader1 = iter(buffer)
+            self.assertEqual({'a': 0}, next(reader1))
+            reader2 = iter(buffer)
+            self.assertEqual(list(range(1000)), [t['a'] for t in reader2])
+            self.assertEqual(
+                list(range(1, 1000)),
+                [next(reader1)['a'] for _ in range(999)])
+            self.assertRaises(StopIteration, next, reader1)
+            self.assertLessEqual(buffer.offset, 1000)
+            self.assertGreater(buffer.offset, 900)
+
+    def test_memorizing_buffer_threads(self):
+        engine = self.engine.copy({'yaql.spillThreshold': 0})
+        buffer = utils.MemorizingBuffer(
+            ({'a': i} for i in range(3000)), engine, chunk_size=4)
+        results = []
+
+        def read():
+            results.append([t['a'] for t in buffer])
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([list(range(3000))] * 4, results)
+
+
+@testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+class TestColumnarQueries(TestQueries):
+    _default_columnar_engine = None
+
+    engine_options = dict(
+        TestQueries.engine_options, **{'yaql.columnar': True})
+
+    def create_engine(self):
+        engine = TestColumnarQueries._default_columnar_engine
+        if engine is None:
+            engine_factory = factory.YaqlFactory(allow_delegates=True)
+            TestColumnarQueries._default_columnar_engine = engine = \
+                engine_factory.create(options=self.engine_options)
+        return engine
@@ -12,6 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import fnmatch
+import re
+
+from yaql.language import exceptions
+from yaql.language import expressions
+from yaql.language import specs
+from yaql.language import utils
+from yaql.language import yaqltypes
+from yaql.standard_library import regex
 import yaql.tests
 
 
@@ -150,3 +159,87 @@ class TestRegex(yaql.tests.TestCase):
         self.assertTrue(self.eval('isRegex(regex("a.b"))'))
         self.assertFalse(self.eval('isRegex(123)'))
         self.assertFalse(self.eval('isRegex(abc)'))
+
+    def test_constant_patterns(self):
+        expr = self.engine("[$ =~ 'a.b', $ !~ 'a.b', "
+                           "regex('A.B', ignoreCase => true).matches($)]")
+        self.assertEqual(
+            [True, False, True],
+            expr.evaluate(data='axb', context=self.context))
+        self.assertEqual(
+            [False, True, False],
+            expr.evaluate(data='abx', context=self.context))
+        targets = [t.args[1] for t in expr.expression.args[:2]]
+        targets.append(expr.expression.args[2].args[0])
+        for target in targets:
+            self.assertIsInstance(
+                target, expressions.ConstantRegexExpression)
+            regexp = target(utils.NO_VALUE, self.context, self.engine)
+            self.assertIsInstance(regexp, regex.REGEX_TYPE)
+            self.assertIs(
+                regexp, target(utils.NO_VALUE, self.context, self.engine))
+        self.assertEqual(
+            "#list(#operator_=~($, 'a.b'), #operator_!~($, 'a.b'), "
+            "#operator_.(regex('A.B', 'ignoreCase' => True), matches($)))",
+            str(expr))
+
+        self.assertNotIsInstance(
+            self.engine("$ =~ $pattern").expression.args[1],
+            expressions.ConstantRegexExpression)
+
+        # only nodes on the path to the replaced ones are copied
+        expr = self.engine("[$.select($ + 1), [$ =~ 'a.b']]")
+        original = expr._original.args[0]
+        self.assertIs(original.args[0], expr.expression.args[0])
+        self.assertIsNot(original.args[1], expr.expression.args[1])
+        self.assertNotIsInstance(
+            original.args[1].args[0].args[1],
+            expressions.ConstantRegexExpression)
+        self.assertIsNone(self.engine("$ =~ $pattern")._original)
+        self.assertRaises(
+            exceptions.NoMethodRegisteredException,
+            self.eval, "'a'.regex('a')")
+
+        # overridden functions get the original pattern string
+        context = self.context.create_child_context()
+
+        @specs.parameter('pattern', yaqltypes.String())
+        @specs.name('#operator_=~')
+        def glob(string, pattern):
+            return fnmatch.fnmatch(string, pattern)
+
+        context.register_function(glob)
+        self.assertTrue(self.eval("'a.b' =~ '?.*'", context=context))
+        self.assertFalse(self.eval("'ab' =~ 'a.b'", context=context))
+
+    def test_match_any(self):
+        self.assertTrue(self.eval("abc.matchAny(['x+', 'a.c'])"))
+        self.assertFalse(self.eval("ABC.matchAny(['x+', 'a.c'])"))
+        self.assertTrue(
+            self.eval("ABC.matchAny(['x+', 'a.c'], ignoreCase => true)"))
+        self.assertFalse(self.eval("abc.matchAny([])"))
+        # patterns that cannot be joined are matched one by one
+        self.assertTrue(self.eval(r"abb.matchAny(['(a)\\1', '(b)\\1'])"))
+        self.assertTrue(self.eval("b.matchAny(['(?P<x>a)', '(?P<x>b)'])"))
+        self.assertRaises(re.error, self.eval, "a.matchAny(['a', ')('])")
+
+    def test_pattern_cache(self):
+        cache = regex.PatternCache(max_size=2)
+        cache.compile('a+')
+        cache.compile('a+')
+        self.assertEqual(
+            re.IGNORECASE, cache.compile('a+', re.IGNORECASE).flags & re.I)
+        # evicts the least recently used 'a+'
+        cache.compile('b+')
+        cache.compile('a+')
+        self.assertEqual(
+            {'size': 2, 'maxSize': 2, 'hits': 1, 'misses': 4},
+            cache.report())
+        cache.clear()
+        self.assertEqual(0, cache.report()['size'])
+
+        regexp = regex.compile_literals(['ab', 'abc', 'b.'])
+        self.assertEqual('ab', regexp.match('abd').group())
+        self.assertIsNone(regexp.match('bc'))
+        regexp = regex.compile_literals(['ab', 'cd'], reverse=True)
+        self.assertIsNotNone(regexp.match('dczyx'))
@@ -13,6 +13,9 @@
 #    under the License.
 
 from yaql.language import exceptions
+from yaql.language import expressions
+from yaql.language import utils
+from yaql.standard_library import strings
 import yaql.tests
 
 
@@ -95,6 +98,55 @@ class TestStrings(yaql.tests.TestCase):
             'Ayfalse2D!', self.eval(
                 "A122Dnull.replace({1 => y, 2 => false, null => '!'}, 1)"))
 
+    def test_replace_with_large_dict(self):
+        replacements = {'k{}'.format(i): 'v{}'.format(i) for i in range(10)}
+        # values are not replaced again by the keys before them
+        replacements['x'] = 'k1'
+        data = {'s': 'k1-k9-x-x-k1-k9', 'r': replacements}
+        self.assertEqual(
+            'v1-v9-k1-k1-v1-v9', self.eval('$.s.replace($.r)', data=data))
+        self.assertEqual(
+            'v1-v9-k1-x-k1-k9', self.eval('$.s.replace($.r, 1)', data=data))
+        self.assertIsNotNone(strings._compile_replacements(
+            tuple(replacements.items())))
+
+        # but they are by the keys after them
+        replacements = data['r'] = dict(replacements, k9='x')
+        self.assertEqual(
+            'v1-k1-k1-k1-v1-k1', self.eval('$.s.replace($.r)', data=data))
+        self.assertIsNone(strings._compile_replacements(
+            tuple(replacements.items())))
+
+    def test_replace_with_constant_dict(self):
+        expr = self.engine(
+            "$.replace({k0 => v0, k1 => v1, k2 => v2, k3 => v3, k4 => v4, "
+            "k5 => v5, k6 => v6, k7 => v7, 8 => true, x => k1})")
+        self.assertEqual(
+            'v1-ktrue-k1-k1', expr.evaluate(data='k1-k8-x-x',
+                                            context=self.context))
+        target = expr.expression.args[1].args[0]
+        self.assertIsInstance(
+            target, expressions.ConstantReplacementsExpression)
+        # the dictionary is prepared once per engine
+        replacements = target(utils.NO_VALUE, self.context, self.engine)
+        self.assertIsNotNone(replacements.replacer)
+        self.assertIs(
+            replacements,
+            target(utils.NO_VALUE, self.context, self.engine))
+        self.assertEqual(
+            'AyfalseD',
+            self.eval('A12D.replace({1 => y, 2 => false})'))
+
+        # overridden str() is used for the original dictionary
+        context = self.context.create_child_context()
+        context.register_function(
+            lambda value: str(value).upper(), name='str')
+        self.assertEqual(
+            'V1-TRUE-K1-K1', expr.evaluate(data='K1-8-X-X', context=context))
+        self.assertNotIsInstance(
+            self.engine('$.replace({k0 => $})').expression.args[1].args[0],
+            expressions.ConstantReplacementsExpression)
+
     def test_in(self):
         self.assertTrue(self.eval("B in ABC"))
         self.assertFalse(self.eval("D in ABC"))
@@ -179,6 +231,10 @@ class TestStrings(yaql.tests.TestCase):
         self.assertRaises(
             exceptions.NoMatchingMethodException,
             self.eval, "ABC.startsWith(null)")
+        prefixes = ', '.join('x{}'.format(i) for i in range(10))
+        self.assertTrue(self.eval("x71.startsWith({})".format(prefixes)))
+        self.assertTrue(self.eval("ABC.startsWith({}, AB)".format(prefixes)))
+        self.assertFalse(self.eval("Ax1.startsWith({})".format(prefixes)))
 
     def test_ends_with(self):
         self.assertTrue(self.eval("ABC.endsWith(C)"))
@@ -187,6 +243,10 @@ class TestStrings(yaql.tests.TestCase):
         self.assertRaises(
             exceptions.NoMatchingMethodException,
             self.eval, "ABC.endsWith(null)")
+        suffixes = ', '.join('x{}'.format(i) for i in range(10))
+        self.assertTrue(self.eval("Ax1.endsWith({})".format(suffixes)))
+        self.assertTrue(self.eval("ABC.endsWith({}, BC)".format(suffixes)))
+        self.assertFalse(self.eval("x1A.endsWith({})".format(suffixes)))
 
     def test_hex(self):
         self.assertEqual('0xff', self.eval('hex(255)'))
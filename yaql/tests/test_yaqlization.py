@@ -13,6 +13,9 @@
 #    under the License.
 
 import re
+import threading
+import time
+import traceback
 
 from yaql.language import exceptions
 from yaql import tests
@@ -187,3 +190,79 @@ class TestYaqlization(tests.TestCase):
             attr = 555
 
         self.assertEqual(555, self.eval('$.attr', C()))
+
+    def test_concurrent_method_calls(self):
+        lock = threading.Lock()
+        active = [0, 0]
+        calls = []
+
+        @yaqlization.yaqlize(max_concurrent_calls=3)
+        class Node:
+            def __init__(self, name):
+                self.name = name
+
+            def fetch_status(self):
+                with lock:
+                    calls.append(self.name)
+                    active[0] += 1
+                    active[1] = max(active)
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+                if self.name == 'bad':
+                    raise ValueError(self.name)
+                return self.name.upper()
+
+        names = ['n{0}'.format(i) for i in range(10)]
+        self.assertEqual(
+            [name.upper() for name in names],
+            self.eval('$.select($.fetch_status())',
+                      data=[Node(name) for name in names]))
+        self.assertEqual(3, active[1])
+
+        del calls[:]
+        try:
+            self.eval('$.select($.fetch_status())',
+                      data=[Node('a'), Node('bad')] +
+                      [Node(name) for name in names])
+        except ValueError as e:
+            frames = traceback.extract_tb(e.__traceback__)
+            self.assertEqual('fetch_status', frames[-1].name)
+        else:
+            self.fail('ValueError was not raised')
+        self.assertEqual(0, active[0])
+        self.assertLessEqual(len(calls), 5)
+        started = len(calls)
+        time.sleep(0.1)
+        self.assertEqual(started, len(calls))
+
+        active[1] = 0
+        yaqlization.get_yaqlization_settings(Node)['maxConcurrentCalls'] = 1
+        self.assertEqual(
+            ['A', 'B'], self.eval('$.select($.fetch_status())',
+                                  data=[Node('a'), Node('b')]))
+        self.assertEqual(1, active[1])
+
+    def test_concurrent_method_calls_mixed_items(self):
+        threads = []
+
+        class Item:
+            def __init__(self, name):
+                self.name = name
+
+            def fetch_status(self):
+                threads.append((self.name, threading.current_thread()))
+                time.sleep(0.01)
+                return self.name
+
+        Serial = yaqlization.yaqlize(type('Serial', (Item,), {}))
+        Concurrent = yaqlization.yaqlize(
+            type('Concurrent', (Item,), {}), max_concurrent_calls=4)
+        data = [Serial('s1'), Concurrent('c1'), Concurrent('c2'),
+                Serial('s2'), Concurrent('c3')]
+        self.assertEqual(
+            ['s1', 'c1', 'c2', 's2', 'c3'],
+            self.eval('$.select($.fetch_status())', data=data))
+        main = threading.current_thread()
+        for name, thread in threads:
+            self.assertEqual(name.startswith('s'), thread is main, name)
@@ -14,11 +14,16 @@
 
 YAQLIZATION_ATTR = '__yaqlization__'
 
+# set once anything is yaqlized with max_concurrent_calls, so that select()
+# does not check items for it otherwise
+_concurrent_calls = False
+
 
 def yaqlize(class_or_object=None, yaqlize_attributes=True,
             yaqlize_methods=True, yaqlize_indexer=True,
             auto_yaqlize_result=False, whitelist=None, blacklist=None,
-            attribute_remapping=None, blacklist_remapped_attributes=True):
+            attribute_remapping=None, blacklist_remapped_attributes=True,
+            max_concurrent_calls=None):
     def func(something):
         if not hasattr(something, YAQLIZATION_ATTR):
             setattr(something, YAQLIZATION_ATTR, build_yaqlization_settings(
@@ -29,6 +34,7 @@ def yaqlize(class_or_object=None, yaqlize_attributes=True,
                 whitelist=whitelist,
                 blacklist=blacklist,
                 attribute_remapping=attribute_remapping,
+                max_concurrent_calls=max_concurrent_calls,
             ))
         return something
     if class_or_object is None:
@@ -45,10 +51,19 @@ def is_yaqlized(class_or_object):
     return hasattr(class_or_object, YAQLIZATION_ATTR)
 
 
+def has_concurrent_calls():
+    return _concurrent_calls
+
+
 def build_yaqlization_settings(
         yaqlize_attributes=True, yaqlize_methods=True, yaqlize_indexer=True,
         auto_yaqlize_result=False, whitelist=None, blacklist=None,
-        attribute_remapping=None, blacklist_remapped_attributes=True):
+        attribute_remapping=None, blacklist_remapped_attributes=True,
+        max_concurrent_calls=None):
+    global _concurrent_calls
+
+    if max_concurrent_calls:
+        _concurrent_calls = True
     whitelist = set(whitelist or [])
     blacklist = set(blacklist or [])
     attribute_remapping = attribute_remapping or {}
@@ -67,5 +82,6 @@ def build_yaqlization_settings(
         'autoYaqlizeResult': auto_yaqlize_result,
         'whitelist': whitelist,
         'blacklist': blacklist,
-        'attributeRemapping': attribute_remapping
+        'attributeRemapping': attribute_remapping,
+        'maxConcurrentCalls': max_concurrent_calls
     }